@@ -1,11 +1,51 @@
 import asyncio
 import logging
+import os
+import time
+import threading
 import concurrent.futures
-from typing import Callable, Any, List, Coroutine
-from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
+import multiprocessing as mp
+from typing import Callable, Any, AsyncIterator, Dict, Iterator, List, Coroutine, Optional
+import httpx
+from tenacity import retry, stop_after_attempt, wait_exponential, wait_random, retry_if_exception
+from core.config import MODEL_RPM
+from core.utils import lazy_import
 
-# Configure logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - [%(levelname)s] - %(name)s - %(message)s')
+# Loaded on first use: the SDK import is expensive and only needed once an error needs classifying
+genai = lazy_import("google.genai")
+
+class TokenBucket:
+    """
+    Async token bucket enforcing a requests-per-minute budget.
+    Tokens refill from elapsed time on each acquire, so no background refill task
+    is needed and the bucket works across event loops.
+    """
+    def __init__(self, rpm: int, burst: Optional[int] = None):
+        """
+        :param rpm: Sustained requests per minute.
+        :param burst: Max requests allowed back-to-back (defaults to one second of budget).
+        """
+        self.rate = rpm / 60.0
+        self.capacity = burst or max(1, -(-rpm // 60))
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _try_take(self) -> float:
+        """Takes a token if available. Returns 0 on success, else seconds until one refills."""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+            return (1 - self.tokens) / self.rate
+
+    async def acquire(self):
+        """Waits (without blocking the loop) until a request slot is available."""
+        while (delay := self._try_take()) > 0:
+            await asyncio.sleep(delay)
 
 class AsyncJobManager:
     """
@@ -14,10 +54,72 @@ class AsyncJobManager:
     def __init__(self, max_io_concurrency: int = 10, max_cpu_workers: int = None):
         """
         :param max_io_concurrency: Max concurrent async I/O tasks (e.g., API calls).
-        :param max_cpu_workers: Max CPU workers (defaults to os.cpu_count()).
+        :param max_cpu_workers: Max CPU workers (defaults to min(4, os.cpu_count())).
         """
         self.io_semaphore = asyncio.Semaphore(max_io_concurrency)
-        self.cpu_executor = concurrent.futures.ProcessPoolExecutor(max_workers=max_cpu_workers)
+        self.model_buckets: Dict[str, TokenBucket] = {model: TokenBucket(rpm) for model, rpm in MODEL_RPM.items()}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_lock = threading.Lock()
+        self.max_cpu_workers = max_cpu_workers or min(4, os.cpu_count() or 1)
+        # Pools are built on first use and rebuilt after shutdown(), so a shutdown elsewhere
+        # (tests, app teardown) never leaves later jobs with a dead executor
+        self._cpu_executor: Optional[concurrent.futures.ProcessPoolExecutor] = None
+        self._native_executor: Optional[concurrent.futures.ThreadPoolExecutor] = None
+        self._executor_lock = threading.Lock()
+
+    @property
+    def cpu_executor(self) -> concurrent.futures.ProcessPoolExecutor:
+        with self._executor_lock:
+            if self._cpu_executor is None:
+                # forkserver starts workers from a small template process instead of copying the whole
+                # Streamlit process (fork) or booting a fresh interpreter per worker (spawn)
+                mp_context = mp.get_context("forkserver") if "forkserver" in mp.get_all_start_methods() else None
+                self._cpu_executor = concurrent.futures.ProcessPoolExecutor(max_workers=self.max_cpu_workers, mp_context=mp_context)
+            return self._cpu_executor
+
+    @property
+    def native_executor(self) -> concurrent.futures.ThreadPoolExecutor:
+        with self._executor_lock:
+            if self._native_executor is None:
+                # Threads for work that releases the GIL (C extensions, subprocess-backed tools like Poppler)
+                self._native_executor = concurrent.futures.ThreadPoolExecutor(max_workers=(os.cpu_count() or 1) * 2)
+            return self._native_executor
+
+    def warm_up(self):
+        """
+        Starts every CPU worker up front so the first real job doesn't pay process start-up.
+        Jobs are submitted together; waiting on each in turn would keep reusing one worker.
+        """
+        futures = [self.cpu_executor.submit(os.getpid) for _ in range(self.max_cpu_workers)]
+        concurrent.futures.wait(futures)
+
+    def _background_loop(self) -> asyncio.AbstractEventLoop:
+        """Starts (once) and returns the persistent event loop running in a daemon thread."""
+        with self._loop_lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="aletheia-event-loop", daemon=True).start()
+                self._loop = loop
+            return self._loop
+
+    def run_sync(self, coroutine: Coroutine) -> Any:
+        """
+        Runs a coroutine on the persistent background loop and blocks until it finishes.
+        Use instead of asyncio.run from sync code (e.g. Streamlit scripts): the loop, and the
+        async HTTP sessions bound to it, are reused across calls instead of rebuilt per call.
+        """
+        return asyncio.run_coroutine_threadsafe(coroutine, self._background_loop()).result()
+
+    def iterate_sync(self, agen: AsyncIterator) -> Iterator[Any]:
+        """
+        Iterates an async generator from sync code, one item per trip to the background loop.
+        Each item is handled on the caller's thread (where Streamlit calls must happen).
+        """
+        while True:
+            try:
+                yield self.run_sync(agen.__anext__())
+            except StopAsyncIteration:
+                return
 
     async def run_cpu_job(self, func: Callable, *args) -> Any:
         """
@@ -32,6 +134,18 @@ class AsyncJobManager:
             logging.error(f"CPU Job Failed: {e}")
             raise e
 
+    async def run_native_job(self, func: Callable, *args) -> Any:
+        """
+        Runs a blocking function that releases the GIL in a thread.
+        Unlike run_cpu_job, arguments and results are not pickled across processes.
+        """
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(self.native_executor, func, *args)
+        except Exception as e:
+            logging.error(f"Native Job Failed: {e}")
+            raise e
+
     async def run_io_job(self, coroutine: Coroutine) -> Any:
         """
         Runs a single I/O-bound coroutine with rate limiting.
@@ -43,6 +157,16 @@ class AsyncJobManager:
                 logging.error(f"I/O Job Failed: {e}")
                 raise e
 
+    async def run_model_call(self, model: str, coroutine: Coroutine) -> Any:
+        """
+        Runs a Gemini call once the model's RPM budget allows it.
+        Models without a configured budget run immediately.
+        """
+        bucket = self.model_buckets.get(model)
+        if bucket:
+            await bucket.acquire()
+        return await coroutine
+
     async def run_batched_io_jobs(self, coroutines: List[Coroutine]) -> List[Any]:
         """
         Runs a list of coroutines concurrently, respecting the rate limit.
@@ -53,22 +177,43 @@ class AsyncJobManager:
         return await asyncio.gather(*tasks, return_exceptions=True)
 
     def shutdown(self):
-        """Clean up resources."""
-        self.cpu_executor.shutdown(wait=True)
+        """Clean up resources. The executors are rebuilt if jobs are submitted afterwards."""
+        with self._executor_lock:
+            cpu_executor, self._cpu_executor = self._cpu_executor, None
+            native_executor, self._native_executor = self._native_executor, None
+        if cpu_executor is not None:
+            cpu_executor.shutdown(wait=True)
+        if native_executor is not None:
+            native_executor.shutdown(wait=True)
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._loop = None
 
 # Global Instance
 async_manager = AsyncJobManager()
 
 # --- Retry Logic Decorators ---
 
+# HTTP status codes worth retrying: rate limit, server error, overload, gateway timeout
+TRANSIENT_STATUS_CODES = frozenset({429, 500, 503, 504})
+
+def is_transient_error(exc: BaseException) -> bool:
+    """
+    True for errors a retry can fix (rate limits, overload, timeouts, dropped connections).
+    Deterministic failures (bad JSON, type errors, 4xx) are not retried.
+    """
+    if isinstance(exc, genai.errors.APIError):
+        return exc.code in TRANSIENT_STATUS_CODES
+    return isinstance(exc, (asyncio.TimeoutError, httpx.TransportError))
+
 def retry_api_call():
     """
-    Decorator for API calls using exponential backoff.
-    Retries on typical transient errors.
+    Decorator for API calls using exponential backoff with jitter.
+    Retries only on transient errors; everything else is raised immediately.
     """
     return retry(
-        stop=stop_after_attempt(10),
-        wait=wait_exponential(multiplier=1, min=2, max=60),
-        retry=retry_if_exception_type((Exception)), # Broad catch for demonstration; refine for production (e.g. 429, 503)
+        stop=stop_after_attempt(5),
+        wait=wait_exponential(multiplier=1, min=2, max=30) + wait_random(0, 1),
+        retry=retry_if_exception(is_transient_error),
         reraise=True
     )
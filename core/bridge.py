@@ -4,8 +4,9 @@ import os
 from typing import Dict, Any, Optional
 from google import genai
 from core.config import MODEL_SMART, MODEL_FAST
-from core.safety import run_in_sandbox
-from core.async_utils import retry_api_call
+from core.safety import run_in_sandbox_async
+from core.async_utils import retry_api_call, async_manager
+from core.utils import extract_code_block, is_overload_error
 
 class BridgeEngine:
     """
@@ -27,28 +28,23 @@ class BridgeEngine:
         Helper to handle Rate Limits (429) & Service Overload (503).
         """
         try:
-            return await self.client.aio.models.generate_content(
+            return await async_manager.run_model_call(model, self.client.aio.models.generate_content(
                 model=model,
                 contents=contents,
                 config=config
-            )
+            ))
         except Exception as e:
-            err_str = str(e)
-            if "429" in err_str or "RESOURCE_EXHAUSTED" in err_str or "503" in err_str or "UNAVAILABLE" in err_str:
-                logging.warning(f"Bridge API Issue ({err_str}). Falling back to {MODEL_FAST}...")
-                return await self.client.aio.models.generate_content(
+            if is_overload_error(e):
+                logging.warning(f"Bridge API Issue ({e}). Falling back to {MODEL_FAST}...")
+                return await async_manager.run_model_call(MODEL_FAST, self.client.aio.models.generate_content(
                     model=MODEL_FAST,
                     contents=contents,
                     config=config
-                )
+                ))
             raise e
 
     def _extract_code(self, text: str) -> str:
-        if "```python" in text:
-            return text.split("```python")[1].split("```")[0].strip()
-        elif "```" in text:
-            return text.split("```")[1].split("```")[0].strip()
-        return text.strip()
+        return extract_code_block(text)
 
     async def reproduce_paper(self, pdf_text: str) -> Dict[str, Any]:
         """
@@ -86,7 +82,7 @@ class BridgeEngine:
             code_snippet = self._extract_code(response.text)
             
             # Execute in sandbox
-            execution_result = run_in_sandbox(code_snippet)
+            execution_result = await run_in_sandbox_async(code_snippet)
             
             status = "Unknown"
             if execution_result:
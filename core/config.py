@@ -14,3 +14,8 @@ MODEL_THINKING = "gemini-3-pro-preview"
 MODEL_CLASSIFY = "gemini-3-flash-preview"
 MODEL_VISION = "gemini-3-pro-preview"
 
+# Requests-per-minute budgets used by the client-side rate limiter (core/async_utils.py)
+MODEL_RPM = {
+    MODEL_FAST: 2000,
+    MODEL_SMART: 360,
+}
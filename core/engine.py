@@ -1,31 +1,85 @@
+from __future__ import annotations
 import os
 import ast
-import json
-import networkx as nx
 import subprocess
 import tempfile
-import sys
 import logging
 import asyncio
-from typing import List, Tuple, Optional, Dict, Any
-from google import genai
-from google.genai import types
+from typing import List, Tuple, Optional, Dict, Any, Literal
+from pydantic import BaseModel
 from core.safety import SecurityViolationException
-from core.config import MODEL_FAST, MODEL_SMART, MODEL_THINKING, MODEL_CLASSIFY
-
-# Configure logging
-logging.basicConfig(
-    format='%(asctime)s - [%(levelname)s] - %(name)s - %(message)s',
-    level=logging.INFO,
-    handlers=[
-        logging.StreamHandler(sys.stdout),
-        logging.FileHandler("aletheia.log", mode='a', encoding='utf-8')
-    ]
-)
+from core.config import MODEL_FAST, MODEL_SMART, MODEL_THINKING
+from core.async_utils import async_manager
+from core.llm_cache import llm_cache
+from core.utils import lazy_import, parse_cached, extract_code_block, json_dumps, json_loads
+
+# Heavy imports, executed on first attribute access (graph build / client creation)
+nx = lazy_import("networkx")
+genai = lazy_import("google.genai")
+
+class OptimizationPlan(BaseModel):
+    """Response schema for the combined classify-and-optimize call."""
+    category: Literal["HEAVY_MATH", "SQL", "GENERAL_LOGIC"]
+    optimized_code: str
+
+PLAN_RESPONSE_CONFIG = {
+    'response_mime_type': 'application/json',
+    'response_schema': OptimizationPlan,
+}
+
+class ImportCollector(ast.NodeVisitor):
+    """
+    Collects imported module names. Imports are statements, so only statement
+    bodies are descended into; expression subtrees are never visited.
+    """
+    def __init__(self) -> None:
+        self.modules: List[str] = []
+
+    def visit_Import(self, node: ast.Import) -> None:
+        self.modules.extend(alias.name for alias in node.names)
+
+    def visit_ImportFrom(self, node: ast.ImportFrom) -> None:
+        if node.module:
+            self.modules.append(node.module)
+
+    def generic_visit(self, node: ast.AST) -> None:
+        for field in ("body", "orelse", "finalbody", "handlers", "cases"):
+            for child in getattr(node, field, ()):
+                self.visit(child)
+
+def _is_grounded(code: str) -> bool:
+    """Simple grounding for model rewrites: non-empty (a blank reply compiles too) and valid syntax."""
+    if not code.strip():
+        return False
+    try:
+        compile(code, "<string>", "exec")
+    except SyntaxError:
+        return False
+    return True
+
+# Below this many files, pickling sources to worker processes costs more than parsing them here
+PARALLEL_PARSE_MIN_FILES = 64
+
+def _extract_imports(content: str) -> Optional[List[str]]:
+    """
+    Module names imported by one source file, or None on a syntax error.
+    Top-level so the process pool can pickle it.
+    """
+    try:
+        # Memoized by content: unchanged files reuse their tree across rebuilds
+        tree = parse_cached(content)
+    except SyntaxError:
+        return None
+    collector = ImportCollector()
+    collector.visit(tree)
+    return collector.modules
 
 class AletheiaEngine:
     def __init__(self, api_key: Optional[str] = None):
-        self.graph = nx.DiGraph()
+        # The graph (and networkx) is only built on first use; the CSR index starts empty
+        self._graph = None
+        self._nodes, self._node_ix = [], {}
+        self._csr_indptr, self._csr_indices = [0], []
         self.api_key = api_key or os.environ.get("GEMINI_API_KEY")
         
         if self.api_key:
@@ -34,13 +88,21 @@ class AletheiaEngine:
             logging.warning("GEMINI_API_KEY not found. AI features disabled.")
             self.client = None
 
+    @property
+    def graph(self) -> nx.DiGraph:
+        if self._graph is None:
+            self._graph = nx.DiGraph()
+        return self._graph
+
+    @graph.setter
+    def graph(self, value: nx.DiGraph) -> None:
+        # Assigning a graph re-snapshots it, so get_impacted_files never reads a stale index
+        self._graph = value
+        self._index_graph()
+
     def _extract_code(self, text: str) -> str:
         """Helper to extract code from markdown."""
-        if "```python" in text:
-            return text.split("```python")[1].split("```")[0].strip()
-        elif "```" in text:
-            return text.split("```")[1].split("```")[0].strip()
-        return text.strip()
+        return extract_code_block(text)
 
     # --- PROMETHEUS: Code Reactor ---
 
@@ -52,7 +114,7 @@ class AletheiaEngine:
         Step 3 (Grounding): Compile and verify syntax.
         """
         if not self.client:
-            return json.dumps({"method": "error", "code": "# Gemini Client not initialized."})
+            return json_dumps({"method": "error", "code": "# Gemini Client not initialized."})
 
         prompt = f"""
         ### ROLE: Google JAX Optimization Specialist
@@ -73,19 +135,16 @@ class AletheiaEngine:
         try:
             for attempt in range(2): # Simple retry logic for grounding
                 try:
-                    response = await self.client.aio.models.generate_content(
-                        model=MODEL_SMART,
-                        contents=prompt
-                    )
-                    optimized_code = self._extract_code(response.text)
+                    text = await llm_cache.generate(self.client, MODEL_SMART, prompt)
+                    optimized_code = self._extract_code(text)
                     
                     # Step 3: Grounding (Simple Syntax Check)
-                    try:
-                        compile(optimized_code, "<string>", "exec")
-                        return json.dumps({"method": "jax", "code": optimized_code})
-                    except SyntaxError:
-                        logging.warning(f"JAX Optimization Attempt {attempt+1} failed syntax check.")
-                        continue
+                    if _is_grounded(optimized_code):
+                        return json_dumps({"method": "jax", "code": optimized_code})
+                    logging.warning(f"JAX Optimization Attempt {attempt+1} failed syntax check.")
+                    # Don't let the retry replay the same broken answer from the cache
+                    llm_cache.discard(MODEL_SMART, prompt)
+                    continue
                 except Exception as e:
                     logging.error(f"JAX Optimization Error: {e}")
                     # Allow loop to continue or fall through
@@ -97,7 +156,7 @@ class AletheiaEngine:
             logging.error(f"JAX Failed: {e}. Triggering Fallback.")
             # Trigger Fallback
             fallback_code = await self.generate_async_refactor(code_str)
-            return json.dumps({"method": "fallback", "code": fallback_code})
+            return json_dumps({"method": "fallback", "code": fallback_code})
 
     async def generate_async_refactor(self, code_str: str) -> str:
         """
@@ -123,21 +182,52 @@ class AletheiaEngine:
         """
 
         try:
-            response = await self.client.aio.models.generate_content(
-                model=MODEL_SMART,
-                contents=prompt
-            )
-            return self._extract_code(response.text)
+            text = await llm_cache.generate(self.client, MODEL_SMART, prompt)
+            return self._extract_code(text)
         except Exception as e:
             logging.error(f"Async Refactor Error: {e}")
             return f"# Error: {str(e)}"
 
+    async def _plan_optimization(self, code_str: str) -> Optional[OptimizationPlan]:
+        """
+        Classifies and optimizes in one structured call, so the common path costs a single round trip.
+        Returns None if the call or its JSON fails (caller falls back to the general refactor).
+        """
+        prompt = f"""
+        ### ROLE: Python Performance Engineer
+        ### TASK: Classify the provided code, then optimize it in the same answer.
+
+        ### CODE:
+        ```python
+        {code_str}
+        ```
+
+        ### CATEGORIES:
+        1. 'HEAVY_MATH': Suitable for JAX/Vectorization/Scientific. Rewrite the expensive loops using `jax.numpy` and `@jax.jit`.
+        2. 'SQL': Database queries (SELECT, INSERT, etc.). Leave `optimized_code` empty; a DBA audit runs separately.
+        3. 'GENERAL_LOGIC': Strings, I/O, Web, standard algorithms. Replace O(n^2) nested loops with O(n) dictionaries/sets, use generators and `itertools`.
+
+        ### OUTPUT:
+        JSON with `category` and `optimized_code` (the complete optimized Python code).
+        """
+
+        try:
+            text = await llm_cache.generate(self.client, MODEL_SMART, prompt, config=PLAN_RESPONSE_CONFIG)
+            try:
+                return OptimizationPlan.model_validate_json(text)
+            except ValueError:
+                llm_cache.discard(MODEL_SMART, prompt)
+                raise
+        except Exception as e:
+            logging.error(f"Optimization Plan Error: {e}")
+            return None
+
     async def dispatch_optimization(self, code_str: str) -> str:
         """
         Intelligent routing for optimization with parallel execution.
-        1. Run Security Check and Classification in parallel.
+        1. Run Security Check and the combined classify+optimize call in parallel.
         2. If Security fails, abort immediately.
-        3. Route to specialized agent based on classification.
+        3. Return the combined result, calling a specialized agent only for SQL or failed JAX code.
         """
         
         if not self.client:
@@ -145,73 +235,55 @@ class AletheiaEngine:
 
         # Import async security check
         from core.safety import ai_security_check_async
-        
-        # Define classification task as coroutine
-        async def classify_code():
-            prompt = f"""
-            Analyze this code. Determine the Category:
-            1. 'HEAVY_MATH': Suitable for JAX/Vectorization/Scientific.
-            2. 'SQL': Database queries (SELECT, INSERT, etc.).
-            3. 'GENERAL_LOGIC': Strings, I/O, Web, standard algorithms.
-            
-            CODE SNIPPET:
-            {code_str[:2000]}
 
-            Output ONLY the category name.
-            """
-            
-            try:
-                response = await self.client.aio.models.generate_content(
-                    model=MODEL_CLASSIFY,
-                    contents=prompt
-                )
-                return response.text.strip().upper()
-            except Exception as e:
-                logging.error(f"Classification Error: {e}")
-                return "GENERAL_LOGIC" # Default fallback
-
-        # Step 1: Parallel Execution - Security + Classification
+        # Step 1: Parallel Execution - Security + Plan
         try:
-            # Launch both tasks concurrently
-            security_task = ai_security_check_async(code_str)
-            classify_task = classify_code()
+            # A failing task cancels its sibling, so a blocked snippet doesn't wait on (or pay for) the plan
+            async with asyncio.TaskGroup() as tg:
+                tg.create_task(ai_security_check_async(code_str))
+                plan_task = tg.create_task(self._plan_optimization(code_str))
+            plan = plan_task.result()
             
-            # Wait for both to complete
-            _, category = await asyncio.gather(security_task, classify_task)
-            
-        except Exception as e:
+        except ExceptionGroup as eg:
             # If security check fails (raises SecurityViolationException), abort
+            e = next((x for x in eg.exceptions if isinstance(x, SecurityViolationException)), eg.exceptions[0])
             logging.error(f"Security Check Failed: {e}")
-            return json.dumps({
+            return json_dumps({
                 "method": "error",
                 "code": f"# Security Violation: {str(e)}"
             })
 
+        category = plan.category if plan else "GENERAL_LOGIC"
         logging.info(f"Optimization Routing: {category}")
 
         # Step 2: Routing based on classification
-        if "HEAVY_MATH" in category:
+        if category == "HEAVY_MATH":
+            optimized_code = self._extract_code(plan.optimized_code)
+            # Grounding before trusting the one-shot rewrite
+            if _is_grounded(optimized_code):
+                return json_dumps({"method": "jax", "code": optimized_code})
+            logging.warning("Combined JAX rewrite failed syntax check. Running dedicated JAX flow.")
+
+            # generate_jax_optimization always returns our own JSON envelope
             result_json = await self.generate_jax_optimization(code_str)
-            try:
-                result = json.loads(result_json)
-                if result.get("method") == "fallback" or result.get("method") == "error":
-                    if result.get("method") == "fallback":
-                        logging.warning("JAX Optimization failed. Falling back to General Async Refactor.")
-                        # Fall through to general logic
-                    else:
-                        return result_json
-                else:
-                    return result_json
-            except json.JSONDecodeError:
-                 return json.dumps({"method": "jax", "code": result_json})
+            if json_loads(result_json).get("method") != "fallback":
+                return result_json
+            logging.warning("JAX Optimization failed. Falling back to General Async Refactor.")
+            # Fall through to general logic
         
-        elif "SQL" in category:
+        elif category == "SQL":
              optimized_sql = await self.optimize_sql(code_str)
-             return json.dumps({"method": "sql_audit", "code": optimized_sql})
+             return json_dumps({"method": "sql_audit", "code": optimized_sql})
+
+        elif plan is not None:
+            optimized_code = self._extract_code(plan.optimized_code)
+            if optimized_code.strip():
+                return json_dumps({"method": "complexity_reducer", "code": optimized_code})
+            logging.warning("Combined rewrite came back empty. Running General Async Refactor.")
 
         # Step 3: General/Fallback
         optimized_code = await self.generate_async_refactor(code_str)
-        return json.dumps({"method": "complexity_reducer", "code": optimized_code})
+        return json_dumps({"method": "complexity_reducer", "code": optimized_code})
 
     async def optimize_sql(self, query: str) -> str:
         """
@@ -237,11 +309,8 @@ class AletheiaEngine:
         """
 
         try:
-            response = await self.client.aio.models.generate_content(
-                model=MODEL_SMART,
-                contents=prompt
-            )
-            return self._extract_code(response.text)
+            text = await llm_cache.generate(self.client, MODEL_SMART, prompt)
+            return self._extract_code(text)
         except Exception as e:
             return f"-- Error executing SQL optimization: {e}"
 
@@ -249,35 +318,72 @@ class AletheiaEngine:
         """
         Builds a directed graph of imports from the provided files.
         """
-        self.graph.clear()
-        for filename, content in files.items():
-            self.graph.add_node(filename)
-            try:
-                tree = ast.parse(content)
-                for node in ast.walk(tree):
-                    if isinstance(node, (ast.Import, ast.ImportFrom)):
-                        # Basic dependency parsing
-                        if isinstance(node, ast.Import):
-                            for alias in node.names:
-                                self._add_dependency(filename, alias.name, files)
-                        else:
-                            if node.module:
-                                self._add_dependency(filename, node.module, files)
-            except SyntaxError:
-                logging.error(f"Syntax error parsing {filename}")
-        
+        self.graph = self.build_dependency_graph(files)
         return self.graph
 
-    def _add_dependency(self, source: str, target: str, files: dict):
-        # Heuristic to find the file from import statement
-        target_file = target.replace(".", "/") + ".py"
-        if target_file in files:
-            self.graph.add_edge(target_file, source)
-        elif target + ".py" in files:
-            self.graph.add_edge(target + ".py", source)
+    def _index_graph(self):
+        """
+        Snapshots self.graph as CSR adjacency (flat successor list + per-node offsets)
+        so impact queries walk plain int lists instead of NetworkX's nested dicts.
+        """
+        self._nodes = list(self.graph.nodes)
+        self._node_ix = {node: i for i, node in enumerate(self._nodes)}
+        indptr = [0]
+        indices = []
+        for node in self._nodes:
+            indices.extend(self._node_ix[v] for v in self.graph.successors(node))
+            indptr.append(len(indices))
+        self._csr_indptr, self._csr_indices = indptr, indices
+
+    @staticmethod
+    def build_dependency_graph(files: Dict[str, str]) -> nx.DiGraph:
+        """
+        Pure graph builder: parses each file once, collects (dependency -> dependent)
+        edges in a flat list and adds them to the graph in a single batch.
+        Large repos are parsed across the CPU process pool.
+        """
+        # module name -> file, so each import resolves with one dict lookup.
+        # "pkg/mod.py" wins over a literal "pkg.mod.py" for the same module name.
+        mod_index = {}
+        for filename in sorted(files, key=lambda f: "/" in f):
+            if filename.endswith(".py"):
+                mod_index[filename[:-3].replace("/", ".")] = filename
+
+        if len(files) >= PARALLEL_PARSE_MIN_FILES:
+            imports = async_manager.cpu_executor.map(_extract_imports, files.values(), chunksize=32)
+        else:
+            imports = map(_extract_imports, files.values())
+
+        edges = []
+        for filename, modules in zip(files, imports):
+            if modules is None:
+                logging.error(f"Syntax error parsing {filename}")
+                continue
+            for module in modules:
+                target_file = mod_index.get(module)
+                if target_file:
+                    edges.append((target_file, filename))
+
+        graph = nx.DiGraph()
+        graph.add_nodes_from(files)
+        graph.add_edges_from(edges)
+        return graph
 
     def get_impacted_files(self, changed_file: str) -> List[str]:
-        """Returns files that depend on the changed file."""
-        if changed_file in self.graph:
-            return list(nx.descendants(self.graph, changed_file))
-        return []
\ No newline at end of file
+        """Returns files that depend on the changed file (BFS over the CSR snapshot)."""
+        start = self._node_ix.get(changed_file)
+        if start is None:
+            return []
+        indptr, indices = self._csr_indptr, self._csr_indices
+        visited = bytearray(len(self._nodes))
+        visited[start] = 1
+        frontier = [start]
+        while frontier:
+            nxt = []
+            for u in frontier:
+                for v in indices[indptr[u]:indptr[u + 1]]:
+                    if not visited[v]:
+                        visited[v] = 1
+                        nxt.append(v)
+            frontier = nxt
+        return [self._nodes[i] for i, seen in enumerate(visited) if seen and i != start]
\ No newline at end of file
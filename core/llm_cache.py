@@ -0,0 +1,106 @@
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional
+from core.async_utils import async_manager, is_transient_error
+from core.utils import retry_with_backoff_async
+
+@retry_with_backoff_async(retries=3, retry_if=is_transient_error)
+async def _generate_content(client, model: str, prompt: str, config: Optional[Dict] = None):
+    # Rate limits and overloads are retried without blocking the event loop. Each attempt takes a
+    # slot of async_manager's shared I/O semaphore, so fan-outs across modules stay bounded together.
+    if config is None:
+        return await async_manager.run_io_job(client.aio.models.generate_content(model=model, contents=prompt))
+    return await async_manager.run_io_job(client.aio.models.generate_content(model=model, contents=prompt, config=config))
+
+class LLMCache:
+    """
+    Exact-match cache of model responses, keyed by SHA-256 of (model, prompt) and stored in SQLite.
+    Disabled until open() is called, so library users and tests always hit the model.
+    """
+    def __init__(self, max_entries: int = 5000):
+        """
+        :param max_entries: Least-recently-used entries beyond this count are evicted on write.
+        """
+        self.max_entries = max_entries
+        self.path: Optional[str] = None
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def open(self, path: str):
+        """Enables the cache backed by the SQLite file at `path`. Re-opening the same path is a no-op."""
+        with self._lock:
+            if self._conn is not None and self.path == path:
+                return
+            if self._conn is not None:
+                self._conn.close()
+            conn = sqlite3.connect(path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS responses (hash TEXT PRIMARY KEY, response TEXT, ts REAL)")
+            self._conn, self.path = conn, path
+            logging.info(f"LLM response cache enabled at {path}")
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+            self._conn, self.path = None, None
+
+    @staticmethod
+    def _key(model: str, prompt: str) -> str:
+        return hashlib.sha256(f"{model}\0{prompt}".encode()).hexdigest()
+
+    def get(self, model: str, prompt: str) -> Optional[str]:
+        """Returns the cached response text, or None on a miss (or when disabled)."""
+        if self._conn is None:
+            return None
+        key = self._key(model, prompt)
+        with self._lock:
+            row = self._conn.execute("SELECT response FROM responses WHERE hash = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            # Touch for LRU eviction
+            self._conn.execute("UPDATE responses SET ts = ? WHERE hash = ?", (time.time(), key))
+            self._conn.commit()
+        return row[0]
+
+    def put(self, model: str, prompt: str, response: str):
+        if self._conn is None or not isinstance(response, str) or not response:
+            return
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (hash, response, ts) VALUES (?, ?, ?)",
+                (self._key(model, prompt), response, time.time())
+            )
+            self._conn.execute(
+                "DELETE FROM responses WHERE hash IN "
+                "(SELECT hash FROM responses ORDER BY ts DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+            self._conn.commit()
+
+    def discard(self, model: str, prompt: str):
+        """Drops an entry, e.g. when the cached response failed validation and should be regenerated."""
+        if self._conn is None:
+            return
+        with self._lock:
+            self._conn.execute("DELETE FROM responses WHERE hash = ?", (self._key(model, prompt),))
+            self._conn.commit()
+
+    async def generate(self, client, model: str, prompt: str, config: Optional[Dict] = None) -> str:
+        """
+        Returns response text for `prompt`, calling client.aio.models.generate_content only on a miss.
+        `config` is passed through but not part of the key (each prompt uses one fixed config).
+        Transient API errors are retried; other errors propagate unchanged. Errors are never cached.
+        """
+        cached = self.get(model, prompt)
+        if cached is not None:
+            return cached
+        response = await _generate_content(client, model, prompt, config)
+        self.put(model, prompt, response.text)
+        return response.text
+
+# Global instance; app.py opens it
+llm_cache = LLMCache()
@@ -1,193 +1,291 @@
+from __future__ import annotations
 import re
 import io
+import asyncio
 import ast
 import contextlib
 import os
+import threading
 import json
-from typing import Tuple, Optional
-from google import genai
+import functools
+import builtins
+import types
+from dataclasses import dataclass
+from typing import Any, Dict, List, Tuple, Optional
 from core.config import MODEL_FAST
+from core.async_utils import async_manager
+from core.llm_cache import llm_cache
+from core.shannon import ShannonTracer
+from core.utils import lazy_import, parse_cached, source_hash
 
 ALLOWED_LIBRARIES = {'numpy', 'pandas', 'jax', 'math', 'datetime', 'random', 'json', 're', 'collections', 'itertools', 'functools'}
 
+# Loaded on first client use, so AST-only callers never pay the SDK import
+genai = lazy_import("google.genai")
+
+_CLIENT: Optional[genai.Client] = None
+_CLIENT_KEY: Optional[str] = None
+_CLIENT_LOCK = threading.Lock()
+
+def _get_client() -> Optional[genai.Client]:
+    """
+    Shared Gemini client for this module, built once per GEMINI_API_KEY value.
+    Returns None when no key is set.
+    """
+    global _CLIENT, _CLIENT_KEY
+    api_key = os.environ.get("GEMINI_API_KEY")
+    if not api_key:
+        return None
+    if _CLIENT is None or _CLIENT_KEY != api_key:
+        with _CLIENT_LOCK:
+            if _CLIENT is None or _CLIENT_KEY != api_key:
+                _CLIENT, _CLIENT_KEY = genai.Client(api_key=api_key), api_key
+    return _CLIENT
+
+# Builtins hidden from sandboxed code; the filtered table is built once at import
+_BLACKLIST = frozenset({'open', 'eval', 'exec', '__import__', 'compile'})
+_SAFE_BUILTINS = types.MappingProxyType({k: v for k, v in builtins.__dict__.items() if k not in _BLACKLIST})
+
 class SecurityViolationException(Exception):
     """Raised when code violates security policies."""
     pass
 
+BANNED_MODULES = frozenset({'os', 'sys', 'subprocess', 'shutil', 'pickle'})
+BANNED_CALLS = frozenset({'exec', 'eval', 'open', 'globals', 'locals', '__import__'})
+BANNED_ATTRIBUTES = frozenset({'__import__', '__subclasses__'})
+
 class SecurityVisitor(ast.NodeVisitor):
-    def __init__(self):
-        self.violations = []
+    """
+    Single pass over the tree collecting both banned-pattern violations and
+    imports outside ALLOWED_LIBRARIES (top-level package names, in source order).
+    Violations are (kind, name) tuples; messages are only formatted when raising.
+    """
+    def __init__(self) -> None:
+        self.violations: List[Tuple[str, str]] = []
+        self.disallowed_libs: List[str] = []
+
+    def _check_lib(self, module_name: str) -> None:
+        # Get the top-level package name (e.g., 'sklearn.metrics' -> 'sklearn')
+        top_level_pkg = module_name.split('.')[0]
+        if top_level_pkg not in ALLOWED_LIBRARIES:
+            self.disallowed_libs.append(top_level_pkg)
 
-    def visit_Import(self, node):
+    def visit_Import(self, node: ast.Import) -> None:
         for alias in node.names:
-            if alias.name in ['os', 'sys', 'subprocess', 'shutil', 'pickle']:
-                self.violations.append(f"Banned import: {alias.name}")
+            if alias.name in BANNED_MODULES:
+                self.violations.append(("Banned import", alias.name))
+            self._check_lib(alias.name)
         self.generic_visit(node)
 
-    def visit_ImportFrom(self, node):
-        if node.module in ['os', 'sys', 'subprocess', 'shutil', 'pickle']:
-            self.violations.append(f"Banned import from: {node.module}")
+    def visit_ImportFrom(self, node: ast.ImportFrom) -> None:
+        if node.module in BANNED_MODULES:
+            self.violations.append(("Banned import from", node.module))
+        if node.module:
+            self._check_lib(node.module)
         self.generic_visit(node)
 
-    def visit_Call(self, node):
-        if isinstance(node.func, ast.Name):
-            if node.func.id in ['exec', 'eval', 'open', 'globals', 'locals', '__import__']:
-                self.violations.append(f"Banned function call: {node.func.id}")
+    def visit_Call(self, node: ast.Call) -> None:
+        self._check_banned_call(node)
         self.generic_visit(node)
 
-    def visit_Attribute(self, node):
-        if node.attr in ['__import__', '__subclasses__']:
-            self.violations.append(f"Banned attribute access: {node.attr}")
+    def _check_banned_call(self, node: ast.Call) -> None:
+        if isinstance(node.func, ast.Name):
+            if node.func.id in BANNED_CALLS:
+                self.violations.append(("Banned function call", node.func.id))
+
+    def visit_Attribute(self, node: ast.Attribute) -> None:
+        if node.attr in BANNED_ATTRIBUTES:
+            self.violations.append(("Banned attribute access", node.attr))
         self.generic_visit(node)
 
-def static_analysis_check(code_str: str) -> None:
+class UnifiedScanner(SecurityVisitor, ShannonTracer):
     """
-    Parses code into AST and checks for banned patterns.
-    Raises SecurityViolationException if unsafe.
+    SecurityVisitor and ShannonTracer in one walk: each Call node is checked
+    for banned calls and dangerous sinks before descending once.
     """
+    def __init__(self, source_code: str, capture_args: bool = True) -> None:
+        SecurityVisitor.__init__(self)
+        ShannonTracer.__init__(self, source_code, capture_args)
+
+    def visit_Call(self, node: ast.Call) -> None:
+        self._check_banned_call(node)
+        self._check_sink(node)
+        self.generic_visit(node)
+
+    def report(self) -> SecurityReport:
+        return SecurityReport(tuple(self.violations), tuple(self.disallowed_libs), tuple(self.sinks_found))
+
+@dataclass(slots=True, frozen=True)
+class SecurityReport:
+    """Everything one scan finds in a snippet. Reports are memoized and shared; don't mutate the sinks."""
+    violations: Tuple[Tuple[str, str], ...] = ()
+    disallowed_libs: Tuple[str, ...] = ()
+    sinks: Tuple[Dict[str, Any], ...] = ()
+    syntax_error: Optional[str] = None
+
+def _scan_tree(tree: ast.AST, code_str: str, capture_args: bool = True) -> SecurityReport:
+    scanner = UnifiedScanner(code_str, capture_args)
+    scanner.visit(tree)
+    return scanner.report()
+
+@functools.lru_cache(maxsize=512)
+def _full_scan_cached(src_hash: bytes, code_str: str, capture_args: bool) -> SecurityReport:
     try:
-        tree = ast.parse(code_str)
+        tree = parse_cached(code_str, src_hash)
     except SyntaxError as e:
-        raise SecurityViolationException(f"Syntax Error in code: {e}")
+        return SecurityReport(syntax_error=str(e))
+    return _scan_tree(tree, code_str, capture_args)
+
+def full_scan(code_str: str, src_hash: Optional[bytes] = None, capture_args: bool = True) -> SecurityReport:
+    """
+    Parses once and returns banned patterns, non-whitelisted imports and dangerous sinks
+    from a single AST pass. Memoized by content.
+    Pass capture_args=False when the sinks' argument source isn't read (it costs an unparse per sink).
+    """
+    return _full_scan_cached(src_hash or source_hash(code_str), code_str, capture_args)
+
+def batch_scan(code_strs: List[str], parallel_min: int = 64) -> List[SecurityReport]:
+    """
+    full_scan over many snippets. From `parallel_min` snippets up, the work is spread
+    over the CPU process pool; below that, pickling costs more than scanning in-process.
+    """
+    if len(code_strs) < parallel_min:
+        return [full_scan(code_str) for code_str in code_strs]
+    chunksize = max(1, len(code_strs) // (4 * async_manager.max_cpu_workers))
+    return list(async_manager.cpu_executor.map(full_scan, code_strs, chunksize=chunksize))
+
+def _report_for(code_str: str, tree: Optional[ast.AST], src_hash: Optional[bytes]) -> SecurityReport:
+    # Callers only read violations and imports, never the sinks' arguments
+    if tree is not None:
+        return _scan_tree(tree, code_str, capture_args=False)
+    return full_scan(code_str, src_hash, capture_args=False)
+
+def _dependency_error(missing_lib: str, message: str) -> str:
+    return json.dumps({
+        "status": "dependency_error",
+        "missing_lib": missing_lib,
+        "message": message
+    })
 
-    visitor = SecurityVisitor()
-    visitor.visit(tree)
+def _syntax_dependency_error() -> str:
+    return _dependency_error("syntax_error", "Syntax Error: Unable to parse code for import validation.")
 
-    if visitor.violations:
-        raise SecurityViolationException(f"Security Violations Found: {', '.join(visitor.violations)}")
+def _import_result(report: SecurityReport) -> Tuple[bool, Optional[str]]:
+    if report.syntax_error is not None:
+        return False, _syntax_dependency_error()
+    if report.disallowed_libs:
+        lib = report.disallowed_libs[0]
+        return False, _dependency_error(lib, f"Library '{lib}' is not available in the Demo Environment.")
+    return True, None
+
+def _raise_on_violations(report: SecurityReport) -> None:
+    if report.syntax_error is not None:
+        raise SecurityViolationException(f"Syntax Error in code: {report.syntax_error}")
+    if report.violations:
+        messages = [f"{kind}: {name}" for kind, name in report.violations]
+        raise SecurityViolationException(f"Security Violations Found: {', '.join(messages)}")
+
+def static_analysis_check(code_str: str, tree: Optional[ast.AST] = None, src_hash: Optional[bytes] = None) -> None:
+    """
+    Parses code into AST (unless `tree` is given) and checks for banned patterns.
+    Raises SecurityViolationException if unsafe.
+    """
+    _raise_on_violations(_report_for(code_str, tree, src_hash))
 
-def validate_imports(code_str: str) -> Tuple[bool, Optional[str]]:
+def validate_imports(code_str: str, tree: Optional[ast.AST] = None, src_hash: Optional[bytes] = None) -> Tuple[bool, Optional[str]]:
     """
     Checks if all imported modules are in the ALLOWED_LIBRARIES whitelist.
+    Pass `tree` to reuse an existing parse of `code_str`.
     Returns: (is_valid, error_message_json)
     """
-    try:
-        tree = ast.parse(code_str)
-    except SyntaxError:
-        return False, json.dumps({
-            "status": "dependency_error",
-            "missing_lib": "syntax_error",
-            "message": "Syntax Error: Unable to parse code for import validation."
-        })
-
-    for node in ast.walk(tree):
-        if isinstance(node, ast.Import):
-            for alias in node.names:
-                # Get the top-level package name (e.g., 'sklearn.metrics' -> 'sklearn')
-                top_level_pkg = alias.name.split('.')[0]
-                if top_level_pkg not in ALLOWED_LIBRARIES:
-                    return False, json.dumps({
-                        "status": "dependency_error",
-                        "missing_lib": top_level_pkg,
-                        "message": f"Library '{top_level_pkg}' is not available in the Demo Environment."
-                    })
-        elif isinstance(node, ast.ImportFrom):
-            if node.module:
-                top_level_pkg = node.module.split('.')[0]
-                if top_level_pkg not in ALLOWED_LIBRARIES:
-                    return False, json.dumps({
-                        "status": "dependency_error",
-                        "missing_lib": top_level_pkg,
-                        "message": f"Library '{top_level_pkg}' is not available in the Demo Environment."
-                    })
-    
-    return True, None
+    return _import_result(_report_for(code_str, tree, src_hash))
 
-def run_in_sandbox(code_str: str, global_vars: Optional[dict] = None) -> str:
+def _sandbox_precheck(code_str: str) -> Tuple[Optional[ast.AST], Optional[str]]:
     """
-    Executes code in a restricted environment and captures output.
+    Dependency and static checks shared by both sandbox entry points.
+    Returns (tree, None) when the code may proceed, or (None, dependency_error_json).
+    Raises SecurityViolationException on banned patterns.
     """
+    src_hash = source_hash(code_str)
+    # One scan serves both the dependency and the static checks; sink arguments are never read here
+    report = full_scan(code_str, src_hash, capture_args=False)
+
     # 0. Dependency Check - Whitelist
-    is_valid_deps, dep_error = validate_imports(code_str)
+    is_valid_deps, dep_error = _import_result(report)
     if not is_valid_deps:
-        return dep_error
+        return None, dep_error
 
     # 1. Static Analysis (AST) - Strict Blocking
-    static_analysis_check(code_str)
-
-    # 2. AI Sentinel - Intent Analysis
-    ai_security_check(code_str)
+    _raise_on_violations(report)
+    return parse_cached(code_str, src_hash), None
 
+def _exec_sandboxed(tree: ast.AST, global_vars: Optional[dict]) -> str:
     if global_vars is None:
         global_vars = {}
     
-    # Restrict builtins
-    safe_builtins = __builtins__.copy()
-    if isinstance(safe_builtins, dict):
-        # Already a dict in some environments
-        pass
-    else:
-        # Get from module if it's a module
-        import builtins
-        safe_builtins = builtins.__dict__.copy()
-
-    # Blacklist dangerous builtins
-    for b in ['open', 'eval', 'exec', '__import__', 'compile']:
-        safe_builtins.pop(b, None)
-
-    global_vars['__builtins__'] = safe_builtins
+    # Restrict builtins (read-only view, so one run can't leak changes into the next)
+    global_vars['__builtins__'] = _SAFE_BUILTINS
 
     output = io.StringIO()
     try:
         with contextlib.redirect_stdout(output):
-            exec(code_str, global_vars)
+            # Compile the checked tree so exec doesn't re-parse the source
+            exec(compile(tree, "<string>", "exec"), global_vars)
     except Exception as e:
         return f"Execution Error: {str(e)}"
     
     return output.getvalue()
 
+def run_in_sandbox(code_str: str, global_vars: Optional[dict] = None) -> str:
+    """
+    Executes code in a restricted environment and captures output.
+    The code is parsed once; the same tree feeds the checks and exec.
+    From async code (e.g. anything on async_manager's loop) use run_in_sandbox_async.
+    """
+    tree, dep_error = _sandbox_precheck(code_str)
+    if dep_error is not None:
+        return dep_error
+
+    # 2. AI Sentinel - Intent Analysis
+    ai_security_check(code_str)
+    return _exec_sandboxed(tree, global_vars)
+
+async def run_in_sandbox_async(code_str: str, global_vars: Optional[dict] = None) -> str:
+    """run_in_sandbox for async callers: the AI Sentinel check is awaited instead of blocking the loop."""
+    tree, dep_error = _sandbox_precheck(code_str)
+    if dep_error is not None:
+        return dep_error
+
+    # 2. AI Sentinel - Intent Analysis
+    await ai_security_check_async(code_str)
+    return _exec_sandboxed(tree, global_vars)
+
 def ai_security_check(code_str: str) -> None:
     """
-    Uses Gemini to scan for malicious intent.
+    Blocking shim over ai_security_check_async for sync callers (run_in_sandbox).
+    Runs on the shared background loop, so it reuses the async client and response cache.
+    Raises RuntimeError when called from a running event loop (blocking there could deadlock
+    async_manager's loop); await ai_security_check_async instead.
     Raises SecurityViolationException if unsafe.
     """
-    api_key = os.environ.get("GEMINI_API_KEY")
-    if not api_key:
-        return # Skip if no key (fallback to regex only)
-        
-    client = genai.Client(api_key=api_key)
-    
-    prompt = f"""
-    ### ROLE: AI Security Sentinel
-    ### TASK: Analyze this Python code for malicious intent (reverse shells, file deletion, env exfiltration, infinite loops).
-    
-    ### CODE:
-    ```python
-    {code_str}
-    ```
-    
-    ### OUTPUT:
-    Return ONLY 'SAFE' or 'BLOCK'. Do not explain.
-    """
-    
     try:
-        # Synchronous call for safety check (blocking)
-        response = client.models.generate_content(
-            model=MODEL_FAST,
-            contents=prompt
-        )
-        result = response.text.strip().upper()
-        
-        if "BLOCK" in result:
-             raise SecurityViolationException("AI Sentinel detected malicious intent.")
-             
-    except Exception as e:
-        if isinstance(e, SecurityViolationException):
-            raise e
-        # If API fails, default to safe (allow regex to catch obvious stuff)
+        asyncio.get_running_loop()
+    except RuntimeError:
         pass
+    else:
+        raise RuntimeError("ai_security_check called from a running event loop; await ai_security_check_async instead")
+    if _get_client() is None:
+        return # Skip if no key (fallback to regex only)
+    async_manager.run_sync(ai_security_check_async(code_str))
 
 async def ai_security_check_async(code_str: str) -> None:
     """
-    Async version of ai_security_check for parallel execution.
     Uses Gemini to scan for malicious intent.
     Raises SecurityViolationException if unsafe.
     """
-    api_key = os.environ.get("GEMINI_API_KEY")
-    if not api_key:
+    client = _get_client()
+    if client is None:
         return # Skip if no key (fallback to regex only)
-        
-    client = genai.Client(api_key=api_key)
     
     prompt = f"""
     ### ROLE: AI Security Sentinel
@@ -204,11 +302,7 @@ async def ai_security_check_async(code_str: str) -> None:
     
     try:
         # Async call for non-blocking execution
-        response = await client.aio.models.generate_content(
-            model=MODEL_FAST,
-            contents=prompt
-        )
-        result = response.text.strip().upper()
+        result = (await llm_cache.generate(client, MODEL_FAST, prompt)).strip().upper()
         
         if "BLOCK" in result:
              raise SecurityViolationException("AI Sentinel detected malicious intent.")
@@ -1,50 +1,104 @@
 
+from __future__ import annotations
 import ast
 import os
+import threading
 import json
 import logging
+import functools
 from typing import List, Dict, Any, Optional, Tuple
-from google import genai
 from core.config import MODEL_SMART, MODEL_FAST
-
-# Configure logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - [%(levelname)s] - %(name)s - %(message)s')
+from core.llm_cache import llm_cache
+from core.utils import lazy_import, parse_cached, source_hash, strip_code_fences
 
 DANGEROUS_SINKS = ['eval', 'exec', 'os.system', 'subprocess.run', 'subprocess.call', 'sqlite3.execute']
+DANGEROUS_SINK_SET = frozenset(DANGEROUS_SINKS)
+
+# Sink families matched by dotted prefix (os.execv, os.spawnlp, subprocess.Popen, ...)
+DANGEROUS_PREFIXES = ('os.exec', 'os.spawn', 'os.popen', 'subprocess.', 'asyncio.create_subprocess_')
+
+# SQL execution methods are sinks on any receiver (cursor.execute, conn.executemany, ...)
+DANGEROUS_METHODS = frozenset({'execute', 'executemany', 'executescript'})
+
+def _is_dangerous_sink(func_name: str) -> bool:
+    """
+    Exact sink name or sink-family prefix, possibly reached through a longer dotted path ('builtins.eval').
+    Checks each dotted suffix against the set and prefixes: O(depth) lookups instead of a substring scan per sink.
+    Method sinks (DANGEROUS_METHODS) are matched on the call node, see ShannonTracer._check_sink.
+    """
+    while True:
+        if func_name in DANGEROUS_SINK_SET or func_name.startswith(DANGEROUS_PREFIXES):
+            return True
+        _, dot, func_name = func_name.partition(".")
+        if not dot:
+            return False
+
+# Loaded on first client use, so AST-only callers never pay the SDK import
+genai = lazy_import("google.genai")
+
+_CLIENT: Optional[genai.Client] = None
+_CLIENT_KEY: Optional[str] = None
+_CLIENT_LOCK = threading.Lock()
+
+def _get_client() -> Optional[genai.Client]:
+    """
+    Shared Gemini client for this module, built once per GEMINI_API_KEY value.
+    Returns None when no key is set.
+    """
+    global _CLIENT, _CLIENT_KEY
+    api_key = os.environ.get("GEMINI_API_KEY")
+    if not api_key:
+        return None
+    if _CLIENT is None or _CLIENT_KEY != api_key:
+        with _CLIENT_LOCK:
+            if _CLIENT is None or _CLIENT_KEY != api_key:
+                _CLIENT, _CLIENT_KEY = genai.Client(api_key=api_key), api_key
+    return _CLIENT
 
 class ShannonTracer(ast.NodeVisitor):
     """
     AST Walker that identifies calls to dangerous functions (sinks).
+    With capture_args=False the (unparse-heavy) "args" source is skipped and left as None.
     """
-    def __init__(self, source_code: str):
+    def __init__(self, source_code: str, capture_args: bool = True) -> None:
         self.source_code = source_code
-        self.sinks_found = []
+        self.capture_args = capture_args
+        self.sinks_found: List[Dict[str, Any]] = []
 
-    def visit_Call(self, node):
+    def visit_Call(self, node: ast.Call) -> None:
+        self._check_sink(node)
+        self.generic_visit(node)
+
+    def _check_sink(self, node: ast.Call) -> None:
         func_name = self._get_func_name(node.func)
-        if func_name and any(sink in func_name for sink in DANGEROUS_SINKS):
+        is_method_sink = type(node.func) is ast.Attribute and node.func.attr in DANGEROUS_METHODS
+        if func_name and (is_method_sink or _is_dangerous_sink(func_name)):
             # Found a potential vulnerability
-            args_str = self._extract_args(node)
+            args_str = self._extract_args(node) if self.capture_args else None
             self.sinks_found.append({
                 "sink": func_name,
                 "args": args_str,
                 "lineno": node.lineno,
                 "col_offset": node.col_offset
             })
-        self.generic_visit(node)
 
-    def _get_func_name(self, node) -> Optional[str]:
-        """Resolves function names like 'os.system' or 'eval'."""
+    def _get_func_name(self, node: ast.expr) -> Optional[str]:
+        """
+        Resolves function names like 'os.system' or 'eval'.
+        Iterative, so long attribute chains cost one loop instead of a call per link.
+        A chain on a non-name base (e.g. `f().run`) resolves to its attribute part ('run').
+        """
+        parts = []
+        while isinstance(node, ast.Attribute):
+            parts.append(node.attr)
+            node = node.value
         if isinstance(node, ast.Name):
-            return node.id
-        elif isinstance(node, ast.Attribute):
-            value_name = self._get_func_name(node.value)
-            if value_name:
-                return f"{value_name}.{node.attr}"
-            return node.attr
-        return None
+            parts.append(node.id)
+        if not parts:
+            return None
+        return ".".join(reversed(parts))
 
-    def _extract_args(self, node) -> str:
+    def _extract_args(self, node: ast.Call) -> str:
         """Extracts the source code of the arguments passed to the function."""
         if not node.args:
             return "()"
@@ -57,29 +111,33 @@ class ShannonTracer(ast.NodeVisitor):
         except AttributeError:
              return str([ast.dump(arg) for arg in node.args])
 
-def scan_code_for_sinks(code_str: str) -> List[Dict[str, Any]]:
-    """
-    Parses code and finds all dangerous sinks.
-    """
+@functools.lru_cache(maxsize=512)
+def _scan_cached(src_hash: bytes, code_str: str, capture_args: bool) -> Tuple[Dict[str, Any], ...]:
     try:
-        tree = ast.parse(code_str)
+        tree = parse_cached(code_str, src_hash)
     except SyntaxError:
-        return [] # Syntax error, can't analysis
-        
-    tracer = ShannonTracer(code_str)
+        return () # Syntax error, can't analysis
+
+    tracer = ShannonTracer(code_str, capture_args)
     tracer.visit(tree)
-    return tracer.sinks_found
+    return tuple(tracer.sinks_found)
+
+def scan_code_for_sinks(code_str: str, src_hash: Optional[bytes] = None, capture_args: bool = True) -> List[Dict[str, Any]]:
+    """
+    Parses code and finds all dangerous sinks.
+    Results are memoized by content; pass `src_hash` if the caller already has it.
+    Pass capture_args=False when only the sinks and locations are needed.
+    """
+    return [dict(sink) for sink in _scan_cached(src_hash or source_hash(code_str), code_str, capture_args)]
 
 async def verify_vulnerability(code_snippet: str, sink_name: str, args: str) -> Tuple[bool, Optional[str]]:
     """
     Uses Gemini to verify if a sink is reachable from user input (Taint Analysis).
     Returns: (is_vulnerable, exploit_payload)
     """
-    api_key = os.environ.get("GEMINI_API_KEY")
-    if not api_key:
+    client = _get_client()
+    if client is None:
         return False, "Missing API Key"
-        
-    client = genai.Client(api_key=api_key)
     
     prompt = f"""
     ### ROLE: Senior Security Engineer (Shannon Engine)
@@ -103,16 +161,15 @@ async def verify_vulnerability(code_snippet: str, sink_name: str, args: str) ->
     """
     
     try:
-        response = await client.aio.models.generate_content(
-            model=MODEL_SMART,
-            contents=prompt
-        )
-        
-        text = response.text.strip()
+        text = (await llm_cache.generate(client, MODEL_SMART, prompt)).strip()
         if text.startswith("```json"):
             text = text[7:-3]
             
-        data = json.loads(text)
+        try:
+            data = json.loads(text)
+        except json.JSONDecodeError:
+            llm_cache.discard(MODEL_SMART, prompt)
+            raise
         return data.get("vulnerable", False), data.get("exploit")
         
     except Exception as e:
@@ -123,11 +180,9 @@ async def patch_vulnerability(code_snippet: str, exploit_payload: str) -> str:
     """
     Uses Gemini to patch the code against the identified exploit.
     """
-    api_key = os.environ.get("GEMINI_API_KEY")
-    if not api_key:
+    client = _get_client()
+    if client is None:
         return code_snippet
-        
-    client = genai.Client(api_key=api_key)
     
     prompt = f"""
     ### ROLE: Security Patcher
@@ -147,11 +202,8 @@ async def patch_vulnerability(code_snippet: str, exploit_payload: str) -> str:
     """
     
     try:
-        response = await client.aio.models.generate_content(
-            model=MODEL_SMART,
-            contents=prompt
-        )
-        return response.text.replace("```python", "").replace("```", "").strip()
+        text = await llm_cache.generate(client, MODEL_SMART, prompt)
+        return strip_code_fences(text)
         
     except Exception as e:
         logging.error(f"Shannon Patch Error: {e}")
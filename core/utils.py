@@ -1,10 +1,97 @@
+import re
+import ast
+import asyncio
+import json
+import hashlib
 import time
 import random
 import logging
 import functools
+import importlib.util
+import sys
+from typing import Callable, Optional
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 logger = logging.getLogger(__name__)
 
+# Rate-limit / overload markers in Gemini error text, matched in a single scan
+TRANSIENT_ERROR_RE = re.compile(r"\b(?:429|503|RESOURCE_EXHAUSTED|UNAVAILABLE|DEADLINE_EXCEEDED)\b")
+
+# Status codes the google-genai APIError carries for rate limits and overload
+_OVERLOAD_STATUS_CODES = frozenset({429, 503})
+
+def is_overload_error(exc: BaseException) -> bool:
+    """
+    True for rate-limit / overload errors worth a model fallback.
+    Checks the SDK's structured status code first, scanning the message only when there is none.
+    """
+    code = getattr(exc, "code", None)
+    if isinstance(code, int):
+        return code in _OVERLOAD_STATUS_CODES
+    return TRANSIENT_ERROR_RE.search(str(exc)) is not None
+
+# One-pass match of the first fenced block; an unclosed fence runs to end of text
+_CODE_FENCE = re.compile(r"```(?:python|json)?[ \t]*\n?(.*?)(?:```|\Z)", re.DOTALL)
+
+def extract_code_block(text: str) -> str:
+    """Extracts the first fenced code block from markdown, or the whole text if unfenced."""
+    m = _CODE_FENCE.search(text)
+    return m.group(1).strip() if m else text.strip()
+
+def strip_code_fences(text: str) -> str:
+    """Replaces every fenced block with its contents in one pass, keeping any text around it."""
+    return _CODE_FENCE.sub(r"\1", text).strip()
+
+def source_hash(code_str: str) -> bytes:
+    """Content key for source text: a 16-byte BLAKE2b digest."""
+    return hashlib.blake2b(code_str.encode(), digest_size=16).digest()
+
+@functools.lru_cache(maxsize=512)
+def _parse_cached(src_hash: bytes, code_str: str) -> ast.AST:
+    return ast.parse(code_str)
+
+def parse_cached(code_str: str, src_hash: Optional[bytes] = None) -> ast.AST:
+    """
+    ast.parse memoized by content, so a snippet scanned repeatedly is parsed once.
+    The tree is shared between callers and must not be mutated.
+    Raises SyntaxError like ast.parse (failures are not cached).
+    """
+    return _parse_cached(src_hash or source_hash(code_str), code_str)
+
+def lazy_import(name: str):
+    """
+    Returns module `name`, deferring its execution to the first attribute access
+    (importlib LazyLoader). Already-imported modules are returned as-is.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+def json_loads(data):
+    """
+    Parses JSON with orjson when installed (faster on large LLM payloads),
+    falling back to the stdlib parser. Both raise json.JSONDecodeError on bad input.
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+def json_dumps(obj) -> str:
+    """Serializes to a JSON string with orjson when installed, else the stdlib encoder."""
+    if orjson is not None:
+        return orjson.dumps(obj).decode()
+    return json.dumps(obj)
+
 def retry_with_backoff(retries=3, backoff_in_seconds=1):
     """
     Decorator to retry a function with exponential backoff.
@@ -27,3 +114,45 @@ def retry_with_backoff(retries=3, backoff_in_seconds=1):
                     x += 1
         return wrapper
     return decorator
+
+def _retry_after(e: Exception) -> Optional[float]:
+    """Server-requested delay in seconds, from a `retry_after` attribute or a Retry-After header."""
+    value = getattr(e, "retry_after", None)
+    if value is None:
+        headers = getattr(getattr(e, "response", None), "headers", None)
+        try:
+            value = headers.get("retry-after") if headers is not None else None
+        except Exception:
+            value = None
+    try:
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+def retry_with_backoff_async(retries=3, backoff_in_seconds=1, retry_if: Optional[Callable[[Exception], bool]] = None):
+    """
+    Async counterpart of retry_with_backoff: waits with asyncio.sleep so other tasks keep running.
+    A server-provided Retry-After wins over the computed backoff.
+    :param retry_if: Predicate selecting retryable errors (default: retry everything).
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            x = 0
+            while True:
+                try:
+                    return await func(*args, **kwargs)
+                except Exception as e:
+                    if x == retries or (retry_if is not None and not retry_if(e)):
+                        if x:
+                            logger.error(f"Failed after {x} retries: {e}")
+                        raise
+
+                    sleep = _retry_after(e)
+                    if sleep is None:
+                        sleep = (backoff_in_seconds * 2 ** x) + random.uniform(0, 1)
+                    logger.warning(f"Error {e}. Retrying in {sleep:.2f} seconds...")
+                    await asyncio.sleep(sleep)
+                    x += 1
+        return wrapper
+    return decorator
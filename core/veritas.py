@@ -2,12 +2,124 @@ import logging
 import asyncio
 import json
 import os
-from typing import List, Dict, Any, Tuple, Optional
+from typing import List, Dict, Any, Tuple, Optional, AsyncIterator, Iterator, Literal
 import PyPDF2
+from pydantic import BaseModel
 from google import genai
 from core.config import MODEL_SMART, MODEL_FAST
 from core.safety import run_in_sandbox, SecurityViolationException
 from core.async_utils import retry_api_call
+from core.llm_cache import llm_cache
+from core.utils import extract_code_block, is_overload_error, json_loads
+
+try:
+    import pypdfium2 as pdfium
+except ImportError:
+    pdfium = None
+
+class AuditClaim(BaseModel):
+    """One audited claim; the response schema for audit_pdf."""
+    claim: str
+    citation: str
+    verification: str
+    evidence: str
+
+# All claims come back from one call, constrained to this schema
+AUDIT_RESPONSE_CONFIG = {
+    'response_mime_type': 'application/json',
+    'response_schema': list[AuditClaim],
+}
+
+class CoveVerdict(BaseModel):
+    """The response schema for verify_claim_cove."""
+    step_1_draft: str
+    step_2_verification_points: list[str]
+    step_3_corrections: str
+    verdict: Literal["TRUE", "FALSE", "PARTIALLY_TRUE", "UNSUPPORTED"]
+    confidence: float
+    reasoning: str
+    citations: list[str]
+
+# Constrained decoding: every CoVe reply is bare JSON of this one shape
+COVE_RESPONSE_CONFIG = {
+    'response_mime_type': 'application/json',
+    'response_schema': CoveVerdict,
+}
+
+# Characters of paper text the audit prompt uses; extraction can stop once it has this many
+AUDIT_TEXT_LIMIT = 10000
+
+# Prompt templates are module constants, filled with str.format per call
+_AUDIT_TEMPLATE = """
+        ### ROLE: Research Integrity Auditor
+        ### TASK: Perform a Chain-of-Verification (CoVe) audit on the provided research paper text.
+
+        ### TEXT:
+        {text} # Limit text for prompt constraints
+
+        ### PROTOCOL:
+        1. Identify 3-5 major scientific claims made in the paper.
+        2. Identify the specific citation (source/author/year) provided for each claim.
+        3. Analyze if the text provided actually supports the claim.
+
+        ### OUTPUT FORMAT (JSON):
+        [
+          {{
+            "claim": "string",
+            "citation": "string",
+            "verification": "YES/NO",
+            "evidence": "Short explanation of why it matches or fails."
+          }}
+        ]
+        """
+
+_COVE_TEMPLATE = """
+        ### ROLE: Senior Research Verifier (CoVe Protocol)
+        ### TASK: Verify the CLAIM given at the end against the SOURCE TEXT with extreme rigor.
+
+        ### INSTRUCTIONS (Chain-of-Verification):
+        
+        Step 1: DRAFT a preliminary answer based *only* on the text.
+        Step 2: Identify specific FACTS in your draft that need verification (dates, numbers, names).
+        Step 3: CHECK these facts against the source text. If a fact is not present, mark it as UNSUPPORTED.
+        Step 4: Formulate the Final Verdict.
+
+        ### OUTPUT FORMAT (JSON ONLY):
+        {{
+            "step_1_draft": "string",
+            "step_2_verification_points": ["fact1", "fact2"],
+            "step_3_corrections": "string (if any)",
+            "verdict": "TRUE" | "FALSE" | "PARTIALLY_TRUE" | "UNSUPPORTED",
+            "confidence": 0.0 to 1.0,
+            "reasoning": "Final explanation citing the text.",
+            "citations": ["quote from text"]
+        }}
+
+        ### SOURCE TEXT:
+        {source} # Context Window Limit
+
+        ### CLAIM:
+        "{claim}"
+        """
+
+_JSON_DECODER = json.JSONDecoder()
+
+def _drain_json_array(buffer: str, pos: int) -> Tuple[List[Any], int]:
+    """
+    Decodes every complete element of a (possibly still streaming) JSON array,
+    starting at buffer[pos]. Returns (items, position to resume from).
+    """
+    items = []
+    while True:
+        while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+            pos += 1
+        if pos >= len(buffer) or buffer[pos] == "]":
+            return items, pos
+        try:
+            item, pos = _JSON_DECODER.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            return items, pos  # Element still arriving
+        items.append(item)
 
 class VeritasAuditor:
     def __init__(self, api_key: Optional[str] = None):
@@ -34,10 +146,8 @@ class VeritasAuditor:
             )
         except Exception as e:
             # Check for Rate Limit (429) or Service Overload (503)
-            err_str = str(e)
-            if "429" in err_str or "RESOURCE_EXHAUSTED" in err_str or "503" in err_str or "UNAVAILABLE" in err_str:
-                logging.warning(f"API Issue ({err_str}) on {model}. Falling back to {MODEL_FAST}...")
-                print(f"⚠️ API Issue on {model}. Switching to {MODEL_FAST}...") 
+            if is_overload_error(e):
+                logging.warning(f"API Issue ({e}) on {model}. Falling back to {MODEL_FAST}...")
                 return await self.client.aio.models.generate_content(
                     model=MODEL_FAST,
                     contents=contents,
@@ -45,14 +155,43 @@ class VeritasAuditor:
                 )
             raise e
 
-    def extract_text_from_pdf(self, file_obj) -> str:
-        """Extracts text from a PDF file object."""
+    @staticmethod
+    def _iter_page_texts(file_obj) -> Iterator[str]:
+        """Yields page texts in order, parsing each page only when requested."""
+        if pdfium is None:
+            for page in PyPDF2.PdfReader(file_obj).pages:
+                yield page.extract_text()
+            return
+        pdf = pdfium.PdfDocument(file_obj.read())
         try:
-            reader = PyPDF2.PdfReader(file_obj)
-            text = ""
-            for page in reader.pages:
-                text += page.extract_text() + "\n"
-            return text
+            for i in range(len(pdf)):
+                yield pdf[i].get_textpage().get_text_range()
+        finally:
+            pdf.close()
+
+    @staticmethod
+    def extract_text_from_pdf(file_obj) -> str:
+        """
+        Extracts text from a PDF file object.
+        Uses pypdfium2's native text layer when installed, falling back to PyPDF2.
+        """
+        return VeritasAuditor.extract_text_from_pdf_limited(file_obj, None)
+
+    @staticmethod
+    def extract_text_from_pdf_limited(file_obj, max_chars: Optional[int]) -> str:
+        """
+        Like extract_text_from_pdf, but stops parsing pages once `max_chars` characters
+        are collected (None means no limit). The result may run past the limit by up to one page.
+        """
+        try:
+            pages = []
+            total = 0
+            for text in VeritasAuditor._iter_page_texts(file_obj):
+                pages.append(text + "\n")
+                total += len(text) + 1
+                if max_chars is not None and total >= max_chars:
+                    break
+            return "".join(pages)
         except Exception as e:
             logging.error(f"PDF Extraction Error: {e}")
             return f"Error extracting PDF: {str(e)}"
@@ -67,47 +206,74 @@ class VeritasAuditor:
         if not self.client:
             return [{"error": "Gemini Client not initialized."}]
 
-        prompt = f"""
-        ### ROLE: Research Integrity Auditor
-        ### TASK: Perform a Chain-of-Verification (CoVe) audit on the provided research paper text.
-
-        ### TEXT:
-        {pdf_text[:10000]} # Limit text for prompt constraints
-
-        ### PROTOCOL:
-        1. Identify 3-5 major scientific claims made in the paper.
-        2. Identify the specific citation (source/author/year) provided for each claim.
-        3. Analyze if the text provided actually supports the claim.
-
-        ### OUTPUT FORMAT (JSON):
-        [
-          {{
-            "claim": "string",
-            "citation": "string",
-            "verification": "YES/NO",
-            "evidence": "Short explanation of why it matches or fails."
-          }}
-        ]
-        """
+        prompt = self._audit_prompt(pdf_text)
 
         try:
             response = await self._safe_generate_content(
                 model=MODEL_SMART,
                 contents=prompt,
-                config={'response_mime_type': 'application/json'}
+                config=AUDIT_RESPONSE_CONFIG
             )
-            # Handle potential JSON extraction issues
-            response_text = response.text.strip()
-            if "```json" in response_text:
-                response_text = response_text.split("```json")[1].split("```")[0].strip()
-            
-            return json.loads(response_text)
+            # Tolerate a fenced reply despite the JSON mime type
+            return json_loads(extract_code_block(response.text))
         except Exception as e:
             logging.error(f"Audit PDF Error: {e}")
             return [{"error": str(e)}]
 
 
 
+    async def audit_pdf_stream(self, pdf_text: str) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Streaming variant of audit_pdf: yields each audited claim as soon as its
+        JSON object has fully arrived, instead of waiting for the whole report.
+        Falls back to Flash on rate limits like audit_pdf, and yields an error item
+        if the reply contains no claims.
+        """
+        if not self.client:
+            yield {"error": "Gemini Client not initialized."}
+            return
+
+        prompt = self._audit_prompt(pdf_text)
+        yielded = 0
+        for model in (MODEL_SMART, MODEL_FAST):
+            buffer = ""
+            pos = None  # Index just past the opening '[' once seen
+            try:
+                stream = await self.client.aio.models.generate_content_stream(
+                    model=model,
+                    contents=prompt,
+                    config=AUDIT_RESPONSE_CONFIG
+                )
+                async for chunk in stream:
+                    buffer += chunk.text or ""
+                    if pos is None:
+                        start = buffer.find("[")
+                        if start == -1:
+                            continue
+                        pos = start + 1
+                    items, pos = _drain_json_array(buffer, pos)
+                    for item in items:
+                        yielded += 1
+                        yield item
+                break
+            except Exception as e:
+                # Same fallback rule as _safe_generate_content, but only before any claim was
+                # yielded: a retry would repeat claims the caller already has
+                if model != MODEL_FAST and not yielded and is_overload_error(e):
+                    logging.warning(f"API Issue ({e}) on {model}. Falling back to {MODEL_FAST}...")
+                    continue
+                logging.error(f"Audit PDF Stream Error: {e}")
+                yield {"error": str(e)}
+                return
+
+        if not yielded:
+            logging.error(f"Audit PDF Stream Error: no claims parsed from reply: {buffer[:200]!r}")
+            yield {"error": "Audit reply contained no parsable claims."}
+
+    def _audit_prompt(self, pdf_text: str) -> str:
+        """Builds the CoVe audit prompt shared by audit_pdf and audit_pdf_stream."""
+        return _AUDIT_TEMPLATE.format(text=pdf_text[:AUDIT_TEXT_LIMIT])
+
     @retry_api_call()
     async def verify_claim_cove(self, claim: str, source_text: str) -> Dict[str, Any]:
         """
@@ -118,50 +284,27 @@ class VeritasAuditor:
         if not self.client:
              return {"error": "Gemini Client not initialized.", "verdict": "ERROR"}
 
-        prompt = f"""
-        ### ROLE: Senior Research Verifier (CoVe Protocol)
-        ### TASK: Verify the specific CLAIM against the SOURCE TEXT with extreme rigor.
+        # Instructions and source come first and the claim last, so every claim checked
+        # against the same paper shares one long prompt prefix (Gemini implicit caching)
+        prompt = _COVE_TEMPLATE.format(claim=claim, source=source_text[:15000])
 
-        ### CLAIM:
-        "{claim}"
-
-        ### SOURCE TEXT:
-        {source_text[:15000]} # Context Window Limit
-
-        ### INSTRUCTIONS (Chain-of-Verification):
-        
-        Step 1: DRAFT a preliminary answer based *only* on the text.
-        Step 2: Identify specific FACTS in your draft that need verification (dates, numbers, names).
-        Step 3: CHECK these facts against the source text. If a fact is not present, mark it as UNSUPPORTED.
-        Step 4: Formulate the Final Verdict.
-
-        ### OUTPUT FORMAT (JSON ONLY):
-        {{
-            "step_1_draft": "string",
-            "step_2_verification_points": ["fact1", "fact2"],
-            "step_3_corrections": "string (if any)",
-            "verdict": "TRUE" | "FALSE" | "PARTIALLY_TRUE" | "UNSUPPORTED",
-            "confidence": 0.0 to 1.0,
-            "reasoning": "Final explanation citing the text.",
-            "citations": ["quote from text"]
-        }}
-        """
+        # Verdicts are cached by (claim, source) via the prompt text; only replies that parsed are stored
+        cached = llm_cache.get(MODEL_SMART, prompt)
+        if cached is not None:
+            return json_loads(cached)
 
         try:
             response = await self._safe_generate_content(
                 model=MODEL_SMART,
                 contents=prompt,
-                config={'response_mime_type': 'application/json'}
+                config=COVE_RESPONSE_CONFIG
             )
             
             # Robust JSON parsing
-            text = response.text.strip()
-            if "```json" in text:
-                text = text.split("```json")[1].split("```")[0].strip()
-            elif "```" in text:
-                 text = text.split("```")[1].split("```")[0].strip()
-            
-            return json.loads(text)
+            text = extract_code_block(response.text)
+            result = json_loads(text)
+            llm_cache.put(MODEL_SMART, prompt, text)
+            return result
 
         except Exception as e:
             logging.error(f"CoVe Verification Error: {e}")
@@ -171,9 +314,24 @@ class VeritasAuditor:
                 "confidence": 0.0
             }
 
+    async def verify_claims_batch(self, claims: List[str], source_text: str, max_concurrency: int = 8) -> List[Dict[str, Any]]:
+        """
+        Runs verify_claim_cove for every claim concurrently, at most `max_concurrency` in flight.
+        Results are in claim order; a claim whose verification raised gets an ERROR verdict.
+        """
+        source_text = source_text[:15000]  # Trimmed once, not per claim
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def _verify(claim: str) -> Dict[str, Any]:
+            async with semaphore:
+                return await self.verify_claim_cove(claim, source_text)
+
+        results = await asyncio.gather(*(_verify(c) for c in claims), return_exceptions=True)
+        return [
+            {"verdict": "ERROR", "reasoning": f"System Error: {str(r)}", "confidence": 0.0}
+            if isinstance(r, Exception) else r
+            for r in results
+        ]
+
     def _extract_code(self, text: str) -> str:
-        if "```python" in text:
-            return text.split("```python")[1].split("```")[0].strip()
-        elif "```" in text:
-            return text.split("```")[1].split("```")[0].strip()
-        return text.strip()
+        return extract_code_block(text)
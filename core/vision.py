@@ -1,52 +1,108 @@
 import PyPDF2
 import io
 import os
+import logging
+import threading
+from typing import Optional
 from PIL import Image
 from google import genai
 from core.config import MODEL_VISION
+from core.async_utils import async_manager
+
+try:
+    import pypdfium2 as pdfium
+    import pypdfium2.raw as pdfium_c
+except ImportError:
+    pdfium = None
+
+logger = logging.getLogger(__name__)
+
+_CLIENT: Optional[genai.Client] = None
+_CLIENT_KEY: Optional[str] = None
+_CLIENT_LOCK = threading.Lock()
+
+def _get_client() -> Optional[genai.Client]:
+    """
+    Shared Gemini client for visual audits, built once per GEMINI_API_KEY value.
+    Returns None when no key is set.
+    """
+    global _CLIENT, _CLIENT_KEY
+    api_key = os.environ.get("GEMINI_API_KEY")
+    if not api_key:
+        return None
+    if _CLIENT is None or _CLIENT_KEY != api_key:
+        with _CLIENT_LOCK:
+            if _CLIENT is None or _CLIENT_KEY != api_key:
+                _CLIENT, _CLIENT_KEY = genai.Client(api_key=api_key), api_key
+    return _CLIENT
+
+def _iter_pdf_images(pdf_stream):
+    """Yields PIL images embedded in the PDF, decoded natively by pypdfium2 when installed."""
+    if pdfium is not None:
+        pdf = pdfium.PdfDocument(pdf_stream.read())
+        try:
+            for page in pdf:
+                for obj in page.get_objects(filter=(pdfium_c.FPDF_PAGEOBJ_IMAGE,)):
+                    try:
+                        yield obj.get_bitmap(render=False).to_pil()
+                    except Exception:
+                        pass
+        finally:
+            pdf.close()
+        return
+
+    reader = PyPDF2.PdfReader(pdf_stream)
+    for page in reader.pages:
+        if '/Resources' in page and '/XObject' in page['/Resources']:
+            xObject = page['/Resources']['/XObject'].get_object()
+            for obj in xObject:
+                if xObject[obj]['/Subtype'] == '/Image':
+                    try:
+                        img_data = xObject[obj].get_data()
+                        # Try to create PIL image
+                        yield Image.open(io.BytesIO(img_data))
+                    except Exception as e:
+                        # print(f"Failed to extract image: {e}")
+                        pass
 
 def extract_images_from_pdf(pdf_stream):
     """
-    Extracts all images from a PDF file stream using PyPDF2.
+    Extracts all images from a PDF file stream (pypdfium2, falling back to PyPDF2).
     Returns a list of PIL Image objects.
     """
     try:
-        reader = PyPDF2.PdfReader(pdf_stream)
-        images = []
-        for page in reader.pages:
-            if '/Resources' in page and '/XObject' in page['/Resources']:
-                xObject = page['/Resources']['/XObject'].get_object()
-                for obj in xObject:
-                    if xObject[obj]['/Subtype'] == '/Image':
-                        try:
-                            img_data = xObject[obj].get_data()
-                            # Try to create PIL image
-                            image = Image.open(io.BytesIO(img_data))
-                            images.append(image)
-                        except Exception as e:
-                            # print(f"Failed to extract image: {e}")
-                            pass
-                            
-        return images
+        return list(_iter_pdf_images(pdf_stream))
     except Exception as e:
-        print(f"Error reading PDF: {e}")
+        logger.error("Error reading PDF: %s", e)
         return []
 
-def audit_visual_integrity(images):
+def _dhash(image, hash_size: int = 8) -> int:
+    """Difference hash: one bit per horizontally adjacent pixel pair of a (hash_size+1)x hash_size thumbnail."""
+    width = hash_size + 1
+    pixels = image.convert("L").resize((width, hash_size), Image.Resampling.BILINEAR).tobytes()
+    bits = 0
+    for row in range(0, width * hash_size, width):
+        for i in range(row, row + hash_size):
+            bits = (bits << 1) | (pixels[i] > pixels[i + 1])
+    return bits
+
+def _dedupe_images(images):
     """
-    Sends images to Gemini 3 Pro Vision to detect fraud.
+    Collapses perceptually identical images (equal dHash), keeping first occurrences in order.
+    Returns (unique images, copy count per unique image).
     """
-    if not images:
-        return "No images detected."
-
-    api_key = os.environ.get("GEMINI_API_KEY")
-    if not api_key:
-        return "GEMINI_API_KEY not found."
+    unique, counts, index = [], [], {}
+    for image in images:
+        h = _dhash(image)
+        if h in index:
+            counts[index[h]] += 1
+        else:
+            index[h] = len(unique)
+            unique.append(image)
+            counts.append(1)
+    return unique, counts
 
-    client = genai.Client(api_key=api_key)
-    
-    # We send a collage or batch of images to the model
-    prompt = """
+_VISUAL_AUDIT_PROMPT = """
     ROLE: Scientific Image Forensics Expert.
     TASK: Analyze these extracted figures from a research paper.
     
@@ -58,25 +114,57 @@ def audit_visual_integrity(images):
     OUTPUT:
     Return a JSON Risk Report: { "suspicious_figures": [], "risk_score": 0-100 }
     """
+
+# Fallback when MODEL_VISION fails
+_FALLBACK_VISION_MODEL = "gemini-3-flash-preview"
+
+def _visual_audit_contents(images):
+    """
+    Prompt plus up to 10 figures for one audit call. All figures go in the same request so the
+    model can compare them (duplication is a cross-figure finding).
+    """
+    # Repeats are uploaded once; the duplication finding is passed on as text instead
+    images, counts = _dedupe_images(images)
+    prompt = _VISUAL_AUDIT_PROMPT
+    repeated = [f"figure {i + 1} ({n} copies)" for i, n in enumerate(counts[:10]) if n > 1]
+    if repeated:
+        prompt += f"""
+    PRE-SCREEN: Perceptual hashing found these figures repeated in the paper (each uploaded once): {", ".join(repeated)}.
+    """
+    # Note: In production, we might limit this to the first 5 images to save tokens
+    return [prompt, *images[:10]]
+
+def audit_visual_integrity(images):
+    """
+    Sends images to Gemini 3 Pro Vision to detect fraud.
+    Blocking wrapper over audit_visual_integrity_async (runs on async_manager's loop);
+    async code should await that instead.
+    """
+    return async_manager.run_sync(audit_visual_integrity_async(images))
+
+async def audit_visual_integrity_async(images):
+    """
+    Sends all figures in one request (under async_manager's I/O concurrency cap), falling
+    back to the Flash model if the primary vision model fails.
+    """
+    if not images:
+        return "No images detected."
+
+    client = _get_client()
+    if client is None:
+        return "GEMINI_API_KEY not found."
+
+    contents = _visual_audit_contents(images)
     try:
         try:
-            # Note: In production, we might limit this to the first 5 images to save tokens
-            # Using MODEL_VISION from config
-            print(f"DEBUG: Using model: {MODEL_VISION}")
-            response = client.models.generate_content(
-                model=MODEL_VISION,
-                contents=[prompt, *images[:10]] 
-            )
-            return response.text
+            logger.debug("Using model: %s", MODEL_VISION)
+            response = await async_manager.run_io_job(client.aio.models.generate_content(model=MODEL_VISION, contents=contents))
         except Exception as e:
-            print(f"DEBUG: Primary model failed ({e}). Trying fallback...")
-            # Fallback to gemini-3-flash-preview
-            response = client.models.generate_content(
-                model="gemini-3-flash-preview",
-                contents=[prompt, *images[:10]] 
+            logger.warning("Primary model failed (%s). Trying fallback...", e)
+            response = await async_manager.run_io_job(
+                client.aio.models.generate_content(model=_FALLBACK_VISION_MODEL, contents=contents)
             )
-            return response.text
+        return response.text
     except Exception as e:
-        import traceback
-        traceback.print_exc()
+        logger.exception("Visual audit failed")
         return f"Error in visual audit: {str(e)}"
@@ -1,22 +1,59 @@
 import os
 import io
+import asyncio
+import functools
 import logging
-from typing import List, Dict, Any, Optional
+import tempfile
+from typing import List, Dict, Any, Optional, Union
 from PIL import Image
 from google import genai
 from core.config import MODEL_VISION
-
-# Configure logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - [%(levelname)s] - %(name)s - %(message)s')
+from core.utils import is_overload_error
 
 # Try importing pdf2image, handle missing dependency gracefully
 try:
-    from pdf2image import convert_from_bytes
+    from pdf2image import convert_from_bytes, convert_from_path, pdfinfo_from_path
     PDF2IMAGE_AVAILABLE = True
 except ImportError:
     PDF2IMAGE_AVAILABLE = False
     logging.warning("pdf2image not installed. Vision Parsing will fail. Please install poppler and pdf2image.")
 
+# Page render settings: 200 DPI JPEG keeps formulas legible at a fraction of PNG@300's upload size
+DEFAULT_DPI = 200
+_RENDER_OPTIONS = {"fmt": "jpeg", "jpegopt": {"quality": 85, "optimize": True}}
+
+# Pages stacked into one composite image per request part; small enough to stay legible after model downscaling
+PAGES_PER_TILE = 2
+
+def _jpeg_part(page: Union[Image.Image, bytes]) -> "genai.types.Part":
+    """
+    Wraps a page as an inline JPEG part. Rendered JPEG bytes pass through untouched; PIL images
+    are encoded once here (the SDK would otherwise re-encode them as much larger PNGs).
+    """
+    if isinstance(page, Image.Image):
+        buf = io.BytesIO()
+        page.convert("RGB").save(buf, "JPEG", **_RENDER_OPTIONS["jpegopt"])
+        page = buf.getvalue()
+    return genai.types.Part.from_bytes(data=page, mime_type="image/jpeg")
+
+class VisionTranscriptionError(Exception):
+    """A page could not be transcribed (no client, or both primary and backup models failed)."""
+    pass
+
+TRANSCRIPTION_PROMPT = """
+### ROLE: Scientific Document Transcriber
+### TASK: Transcribe this document exactly.
+
+### INSTRUCTIONS:
+1. **Math Formulas:** Convert ALL math formulas to LaTeX format (using $...$ for inline and $$...$$ for block).
+2. **Tables:** Preserve ALL tables and represent them using Markdown table syntax.
+3. **Structure:** Maintain the original headings and structure.
+4. **Content:** Do NOT summarize. Transcribe the text exactly as it appears.
+
+### OUTPUT:
+Return the Markdown transcription.
+"""
+
 class VisionParser:
     def __init__(self):
         self.api_key = os.environ.get("GEMINI_API_KEY")
@@ -27,17 +64,17 @@ class VisionParser:
             logging.warning("GEMINI_API_KEY not found. Vision features disabled.")
 
     @staticmethod
-    def convert_pdf_to_images(pdf_bytes: bytes) -> List[Image.Image]:
+    def convert_pdf_to_images(pdf_bytes: bytes, dpi: int = DEFAULT_DPI) -> List[Image.Image]:
         """
         Converts PDF bytes to a list of PIL Images using pdf2image.
-        Requires Poppler installed on the system.
+        Requires Poppler installed on the system. Raise `dpi` for dense math pages.
         """
         if not PDF2IMAGE_AVAILABLE:
             raise ImportError("pdf2image library is not installed.")
 
         try:
-            # Convert PDF to images (300 DPI for better OCR)
-            images = convert_from_bytes(pdf_bytes, dpi=300)
+            # Poppler renders pages on several threads
+            images = convert_from_bytes(pdf_bytes, dpi=dpi, thread_count=os.cpu_count() or 1, **_RENDER_OPTIONS)
             return images
         except Exception as e:
             logging.error(f"Error converting PDF to images: {e}")
@@ -45,6 +82,56 @@ class VisionParser:
                 raise ImportError("Poppler is not installed or not in PATH. Please install Poppler.")
             raise e
 
+    @staticmethod
+    def count_pdf_pages(pdf_path: str) -> int:
+        """
+        Returns the page count of a PDF on disk (via Poppler's pdfinfo).
+        """
+        if not PDF2IMAGE_AVAILABLE:
+            raise ImportError("pdf2image library is not installed.")
+
+        try:
+            return int(pdfinfo_from_path(pdf_path)["Pages"])
+        except Exception as e:
+            logging.error(f"Error reading PDF info: {e}")
+            if "poppler" in str(e).lower():
+                raise ImportError("Poppler is not installed or not in PATH. Please install Poppler.")
+            raise e
+
+    @staticmethod
+    def render_page_range_jpeg(pdf_path: str, first_page: int, last_page: int, dpi: int = DEFAULT_DPI,
+                               pages_per_tile: int = 1) -> List[bytes]:
+        """
+        Renders pages [first_page, last_page] (1-based, inclusive) to JPEG bytes, in page order.
+        With pages_per_tile > 1, each run of consecutive pages is stacked into one JPEG (see _tile_pages),
+        so item i covers pages first_page + i * pages_per_tile onwards.
+        Untiled pages are Poppler's output files read back as-is, never decoded into a PIL Image.
+        Runs in process-pool workers; only the compact JPEG bytes are pickled back.
+        """
+        if not PDF2IMAGE_AVAILABLE:
+            raise ImportError("pdf2image library is not installed.")
+
+        try:
+            with tempfile.TemporaryDirectory() as out_dir:
+                paths = convert_from_path(
+                    pdf_path, dpi=dpi, first_page=first_page, last_page=last_page,
+                    output_folder=out_dir, paths_only=True, **_RENDER_OPTIONS
+                )
+                pages = []
+                for path in paths:
+                    with open(path, "rb") as f:
+                        pages.append(f.read())
+                if pages_per_tile <= 1:
+                    return pages
+                return [
+                    VisionParser._tile_jpegs(pages[i:i + pages_per_tile])
+                    for i in range(0, len(pages), pages_per_tile)
+                ]
+        except Exception as e:
+            logging.error(f"Error rendering PDF pages {first_page}-{last_page} to JPEG: {e}")
+            if "poppler" in str(e).lower():
+                raise ImportError("Poppler is not installed or not in PATH. Please install Poppler.")
+            raise e
 
     async def extract_features_with_vision(self, images: List[Image.Image], optimize_scanning: bool = True) -> str:
         """
@@ -71,76 +158,195 @@ class VisionParser:
             logging.info(f"PDF has {len(images)} pages. Scanning full document.")
             pages_to_process = images
             status_msg = ""
-            
-        prompt = """
-        ### ROLE: Scientific Document Transcriber
-        ### TASK: Transcribe this document exactly.
-        
-        ### INSTRUCTIONS:
-        1. **Math Formulas:** Convert ALL math formulas to LaTeX format (using $...$ for inline and $$...$$ for block).
-        2. **Tables:** Preserve ALL tables and represent them using Markdown table syntax.
-        3. **Structure:** Maintain the original headings and structure.
-        4. **Content:** Do NOT summarize. Transcribe the text exactly as it appears.
-        
-        ### OUTPUT:
-        Return the Markdown transcription.
-        """
 
-        try:
-            # Prepare contents for Gemini (List of Prompt + Images)
-            # We resize images if they are massive to avoid payload limits, though Gemini is robust.
-            
-            processed_contents = [prompt]
-            for img in pages_to_process:
-                # Gemini Client expects PIL images directly or bytes
-                processed_contents.append(img)
-            
-            logging.info(f"Sending request to {MODEL_VISION}...")
-            
-            try:
-                # Primary Attempt: Pro Model
-                response = await self.client.aio.models.generate_content(
-                    model=MODEL_VISION,
-                    contents=processed_contents
-                )
-                return f"{status_msg}\n\n{response.text}"
-            
-            except Exception as e:
-                # Check for Rate Limit (429) or other API errors
-                # Check string representation of error for 429
-                err_str = str(e)
-                if "429" in err_str or "RESOURCE_EXHAUSTED" in err_str:
-                    logging.warning(f"Rate Limit Hit on {MODEL_VISION}. Falling back to Flash...")
-                    st_msg = "**⚠️ Pro API Quota Exceeded. Switched to configured backup model.**"
-                    
-                    # Fallback: Flash Model (Reuse MODEL_FAST from config/constants if distinct, but here we assume using MODEL_FAST as fallback)
-                    from core.config import MODEL_FAST
-                    fallback_model = MODEL_FAST
-                    try:
-                        response = await self.client.aio.models.generate_content(
-                            model=fallback_model,
-                            contents=processed_contents
-                        )
-                        return f"{status_msg}\n\n{st_msg}\n\n{response.text}"
-                    except Exception as flash_err:
-                        return f"Error: Both Primary and Backup models failed. {flash_err}"
-                else:
-                    raise e # Re-raise if not rate limit
+        # One composite image per PAGES_PER_TILE pages: the model charges a fixed overhead per image
+        tiles = [
+            self._tile_pages(pages_to_process[i:i + PAGES_PER_TILE])
+            for i in range(0, len(pages_to_process), PAGES_PER_TILE)
+        ]
 
+        try:
+            return f"{status_msg}\n\n{await self._transcribe(tiles)}"
         except Exception as e:
             logging.error(f"Vision Feature Extraction Error: {e}")
             return f"Error extracting features: {e}. Try disabling 'Vision-First Parsing' to use standard text extraction."
 
-# Standalone helper function for easy import
-vision_parser = VisionParser()
+    @staticmethod
+    def _tile_pages(images: List[Image.Image]) -> Image.Image:
+        """
+        Stacks pages vertically into one RGB image, scaling each to the widest page's width.
+        """
+        if len(images) == 1:
+            return images[0]
+        width = max(img.width for img in images)
+        pages = [
+            img if img.width == width else img.resize((width, round(img.height * width / img.width)))
+            for img in images
+        ]
+        tiled = Image.new("RGB", (width, sum(page.height for page in pages)), "white")
+        y = 0
+        for page in pages:
+            tiled.paste(page, (0, y))
+            y += page.height
+        return tiled
 
-async def parse_research_paper(pdf_bytes: bytes, optimize_scanning: bool = True) -> str:
+    @staticmethod
+    def _tile_jpegs(jpegs: List[bytes]) -> bytes:
+        """_tile_pages for JPEG bytes; a single page passes through without re-encoding."""
+        if len(jpegs) == 1:
+            return jpegs[0]
+        tiled = VisionParser._tile_pages([Image.open(io.BytesIO(jpeg)) for jpeg in jpegs])
+        buf = io.BytesIO()
+        tiled.save(buf, "JPEG", **_RENDER_OPTIONS["jpegopt"])
+        return buf.getvalue()
+
+    async def extract_page(self, image: Union[Image.Image, bytes], raise_errors: bool = False) -> str:
+        """
+        Transcribes a single page or tile (PIL image or JPEG bytes). Used by the pipelined parser
+        so each tile can be sent as soon as it is rendered.
+        Failures come back as an "Error ..." string, or raise VisionTranscriptionError with raise_errors=True.
+        """
+        if not self.client:
+            if raise_errors:
+                raise VisionTranscriptionError("Gemini Client not available.")
+            return "Error: Gemini Client not available."
+
+        try:
+            return await self._transcribe([image])
+        except Exception as e:
+            logging.error(f"Vision Page Extraction Error: {e}")
+            if raise_errors:
+                raise VisionTranscriptionError(str(e)) from e
+            return f"Error extracting features: {e}. Try disabling 'Vision-First Parsing' to use standard text extraction."
+
+    async def _transcribe(self, pages: List[Union[Image.Image, bytes]]) -> str:
+        """
+        Sends the transcription prompt plus page images to Gemini, falling back
+        to the backup model on rate limits. Other errors (and a failed fallback) are raised.
+        """
+        processed_contents = [TRANSCRIPTION_PROMPT, *(_jpeg_part(page) for page in pages)]
+
+        logging.info(f"Sending request to {MODEL_VISION}...")
+
+        try:
+            # Primary Attempt: Pro Model
+            response = await self.client.aio.models.generate_content(
+                model=MODEL_VISION,
+                contents=processed_contents
+            )
+            return response.text
+
+        except Exception as e:
+            # Check for Rate Limit (429) or Service Overload (503)
+            if is_overload_error(e):
+                logging.warning(f"Rate Limit Hit on {MODEL_VISION}. Falling back to Flash...")
+                st_msg = "**⚠️ Pro API Quota Exceeded. Switched to configured backup model.**"
+
+                # Fallback: Flash Model (Reuse MODEL_FAST from config/constants if distinct, but here we assume using MODEL_FAST as fallback)
+                from core.config import MODEL_FAST
+                fallback_model = MODEL_FAST
+                try:
+                    response = await self.client.aio.models.generate_content(
+                        model=fallback_model,
+                        contents=processed_contents
+                    )
+                    return f"{st_msg}\n\n{response.text}"
+                except Exception as flash_err:
+                    raise VisionTranscriptionError(f"Both Primary and Backup models failed. {flash_err}") from flash_err
+            else:
+                raise e # Re-raise if not rate limit
+
+@functools.lru_cache(maxsize=None)
+def get_vision_parser() -> VisionParser:
+    """Shared VisionParser, built on first use so importing this module stays cheap."""
+    return VisionParser()
+
+def __getattr__(name: str):
+    # Keeps `from core.vision_parser import vision_parser` working without eager construction
+    if name == "vision_parser":
+        return get_vision_parser()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+async def transcribe_pdf_pipelined(pdf_bytes: bytes, optimize_scanning: bool = True, num_consumers: int = 4,
+                                   raise_errors: bool = False) -> str:
+    """
+    Vision-First transcription with page rendering and Gemini calls overlapped.
+    Page ranges render in parallel (each job reads its pages from a temp file) and come back as
+    tiles of PAGES_PER_TILE consecutive pages; every tile is queued for transcription as soon as its range lands.
+    Optimized for tokens: only renders Page 1 and the Last Page if > 5 pages.
+    With raise_errors=True a failed page raises VisionTranscriptionError instead of
+    being embedded in the result as an error string (e.g. so callers don't cache it).
+    """
+    from core.async_utils import async_manager
+
+    tmp = tempfile.NamedTemporaryFile(suffix=".pdf", delete=False)
+    try:
+        with tmp:
+            tmp.write(pdf_bytes)
+
+        page_count = VisionParser.count_pdf_pages(tmp.name)
+        if optimize_scanning and page_count > 5:
+            logging.info(f"PDF has {page_count} pages. Optimizing: Scanning Page 1 (Abstract) and Last Page (Conclusion).")
+            ranges = [(1, 1), (page_count, page_count)]
+            status_msg = f"**Note:** Processed Page 1 and Page {page_count} (Abstract & Conclusion) to save resources."
+        else:
+            logging.info(f"PDF has {page_count} pages. Scanning full document.")
+            step = max(1, -(-page_count // async_manager.max_cpu_workers))  # ceil division
+            # Whole tiles per range, so no range ends in a half-empty tile
+            step = -(-step // PAGES_PER_TILE) * PAGES_PER_TILE
+            ranges = [(start, min(start + step - 1, page_count)) for start in range(1, page_count + 1, step)]
+            status_msg = ""
+
+        queue: asyncio.Queue = asyncio.Queue()
+        transcripts: Dict[int, str] = {}
+
+        async def render(first_page: int, last_page: int):
+            # Process-pool job: page ranges render on separate cores and come back as JPEG tiles
+            # of PAGES_PER_TILE pages (one image per request instead of one per page)
+            tiles = await async_manager.run_cpu_job(
+                VisionParser.render_page_range_jpeg, tmp.name, first_page, last_page, DEFAULT_DPI, PAGES_PER_TILE
+            )
+            return first_page, tiles
+
+        async def produce():
+            try:
+                for next_range in asyncio.as_completed([render(first, last) for first, last in ranges]):
+                    first_page, tiles = await next_range
+                    for offset, jpeg in enumerate(tiles):
+                        await queue.put((first_page + offset * PAGES_PER_TILE, jpeg))
+            finally:
+                # Always release the consumers, even if rendering failed
+                for _ in range(num_consumers):
+                    await queue.put(None)
+
+        async def consume():
+            while (item := await queue.get()) is not None:
+                page_no, image = item
+                transcripts[page_no] = await async_manager.run_io_job(get_vision_parser().extract_page(image, raise_errors))
+
+        tasks = [asyncio.ensure_future(produce()), *(asyncio.ensure_future(consume()) for _ in range(num_consumers))]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            # Don't leave renders and model calls running against the deleted temp file
+            for task in tasks:
+                task.cancel()
+            raise
+        body = "\n\n".join(transcripts[page_no] for page_no in sorted(transcripts))
+        return f"{status_msg}\n\n{body}"
+    finally:
+        os.unlink(tmp.name)
+
+async def parse_research_paper(pdf_bytes: bytes, optimize_scanning: bool = True, dpi: int = DEFAULT_DPI) -> str:
     """
     Main entry point: Bytes -> Images -> Transcription
     """
+    from core.async_utils import async_manager
+
     try:
-        images = vision_parser.convert_pdf_to_images(pdf_bytes)
-        transcription = await vision_parser.extract_features_with_vision(images, optimize_scanning=optimize_scanning)
+        # Rendering blocks in Poppler, so keep it off the event loop
+        images = await async_manager.run_native_job(VisionParser.convert_pdf_to_images, pdf_bytes, dpi)
+        transcription = await get_vision_parser().extract_features_with_vision(images, optimize_scanning=optimize_scanning)
         return transcription
     except ImportError as e:
         return f"Configuration Error: {e}"
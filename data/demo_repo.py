@@ -38,3 +38,25 @@ def f(x):
     return x**2 + 2*x + 1
 Result for x=2 should be 9.
 """
+
+# Fallback audit report shown when the Gemini quota is exhausted
+DEMO_AUDIT_RESULTS = (
+    {
+        "claim": "JAX optimization provides 100x speedup for gradient descent.",
+        "citation": "Google Research (2024)",
+        "verification": "YES",
+        "evidence": "The paper correctly cites Google's JAX documentation. Empirical benchmarks confirm 10-100x speedup for gradient operations on GPU/TPU."
+    },
+    {
+        "claim": "Neuro-symbolic validation eliminates hallucinations.",
+        "citation": "DeepMind (2025)",
+        "verification": "NO",
+        "evidence": "The citation year is incorrect - DeepMind has not published this claim as of 2024. The paper appears to be speculative."
+    },
+    {
+        "claim": "Chain-of-Verification reduces hallucinations by 40%.",
+        "citation": "Meta AI Research (2023)",
+        "verification": "YES",
+        "evidence": "This matches the original CoVe paper published by Meta AI. The 40% reduction figure is accurately cited."
+    },
+)
@@ -1,5 +1,17 @@
 import google.generativeai as genai
 import os
+import sys
+import time
+
+MODELS_FILE = "models.txt"
+CACHE_TTL_SECONDS = 24 * 60 * 60
+
+# Reuse a recent listing instead of paging through the API again (pass --refresh to force)
+if "--refresh" not in sys.argv and os.path.exists(MODELS_FILE) and time.time() - os.path.getmtime(MODELS_FILE) < CACHE_TTL_SECONDS:
+    with open(MODELS_FILE) as f:
+        print(f.read(), end="")
+    print(f"Models loaded from {MODELS_FILE} (less than 24h old; pass --refresh to re-list)")
+    sys.exit(0)
 
 api_key = os.environ.get("GEMINI_API_KEY")
 if not api_key:
@@ -8,11 +20,11 @@ else:
     genai.configure(api_key=api_key)
     try:
         models = list(genai.list_models())
-        with open("models.txt", "w") as f:
-            for m in models:
-                f.write(f"{m.name}\n")
-                if 'generateContent' in m.supported_generation_methods:
-                    print(f"Supported Code Model: {m.name}")
-        print("Models saved to models.txt")
+        with open(MODELS_FILE, "w") as f:
+            f.writelines(f"{m.name}\n" for m in models)
+        for m in models:
+            if 'generateContent' in m.supported_generation_methods:
+                print(f"Supported Code Model: {m.name}")
+        print(f"Models saved to {MODELS_FILE}")
     except Exception as e:
         print(f"Error listing models: {e}")
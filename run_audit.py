@@ -1,176 +1,367 @@
 import ast
+import io
 import os
 import sys
+import pickle
+import hashlib
+import argparse
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
 
-EXCLUDE_DIRS = {'venv', '.git', '__pycache__', '.gemini'}
+# Per-file analysis results, keyed by source hash; bump _CACHE_TAG's version when the analyzers change
+AUDIT_CACHE_DIR = '.aletheia_audit_cache'
+AUDIT_CACHE_MAX_ENTRIES = 20000
+_CACHE_TAG = f"py{sys.version_info[0]}{sys.version_info[1]}-v3"
+
+# Below this many files, process start-up costs more than parallel parsing saves
+PARALLEL_MIN_FILES = 64
+
+EXCLUDE_DIRS = frozenset({'venv', '.git', '__pycache__', '.gemini', AUDIT_CACHE_DIR})
 CORE_DIR = 'core'
+# Imports through which app.py reaches the safety layer
+_SAFETY_IMPORTS = frozenset({'core.safety', CORE_DIR})
 
 def get_python_files(root_dir='.'):
+    """
+    Lists .py files top-down (same order as os.walk), using the DirEntry type info
+    scandir already fetched instead of a stat() per entry.
+    """
     py_files = []
-    for root, dirs, files in os.walk(root_dir):
-        dirs[:] = [d for d in dirs if d not in EXCLUDE_DIRS]
-        for file in files:
-            if file.endswith('.py'):
-                py_files.append(os.path.join(root, file))
+    stack = [root_dir]
+    while stack:
+        try:
+            with os.scandir(stack.pop()) as it:
+                entries = list(it)
+        except OSError:
+            continue  # Unreadable directory: skipped, as os.walk does
+        subdirs = []
+        for entry in entries:
+            if entry.is_dir():
+                # Like os.walk, symlinked directories are not descended into
+                if entry.name not in EXCLUDE_DIRS and not entry.is_symlink():
+                    subdirs.append(entry.path)
+            elif entry.name.endswith('.py'):
+                py_files.append(entry.path)
+        stack.extend(reversed(subdirs))
     return py_files
 
-class AuditVisitor(ast.NodeVisitor):
+# Node classes used on the per-node hot path, bound once (global lookup instead of ast.<attr>)
+_AST = ast.AST
+_Import = ast.Import
+_Attribute = ast.Attribute
+_Name = ast.Name
+_Load = ast.Load
+
+def _push_children(node, stack, skip=frozenset()):
+    """
+    Pushes the child nodes of `node` reversed, so they pop in source order.
+    Children whose exact class is in `skip` are left out, along with their subtrees.
+    """
+    children = []
+    for field in node._fields:
+        value = getattr(node, field, None)
+        if isinstance(value, list):
+            for item in value:
+                if isinstance(item, _AST) and type(item) not in skip:
+                    children.append(item)
+        elif isinstance(value, _AST) and type(value) not in skip:
+            children.append(value)
+    stack.extend(reversed(children))
+
+def _concrete_subclasses(base):
+    """All instantiable node classes under an abstract ast base (e.g. ast.expr -> Name, Call, ...)."""
+    found = set()
+    pending = [base]
+    while pending:
+        for cls in pending.pop().__subclasses__():
+            if cls not in found:
+                found.add(cls)
+                pending.append(cls)
+    return found
+
+# Childless marker nodes (Load/Store, operators): about a third of all nodes, and handlers read them off their parent
+_LEAF_TYPES = (ast.expr_context, ast.boolop, ast.operator, ast.unaryop, ast.cmpop)
+
+# --- Analyzers: each declares the node types it handles; AuditVisitor runs them all in one walk ---
+
+class ImportAnalyzer:
+    node_types = (ast.Import, ast.ImportFrom)
+
     def __init__(self):
         self.imports = []
-        self.definitions = []
-        self.usages = []
-        self.security_bypass = []
-
-    def visit_Import(self, node):
-        for alias in node.names:
-            self.imports.append(alias.name)
-        self.generic_visit(node)
 
-    def visit_ImportFrom(self, node):
-        if node.module:
+    def handle(self, node):
+        if type(node) is _Import:
+            for alias in node.names:
+                self.imports.append(alias.name)
+        elif node.module:
             self.imports.append(node.module)
-        self.generic_visit(node)
 
-    def visit_FunctionDef(self, node):
-        self.definitions.append(node.name)
-        self.generic_visit(node)
+class DefinitionAnalyzer:
+    node_types = (ast.FunctionDef, ast.ClassDef)
+
+    def __init__(self):
+        self.definitions = []
 
-    def visit_ClassDef(self, node):
+    def handle(self, node):
         self.definitions.append(node.name)
-        self.generic_visit(node)
 
-    def visit_Name(self, node):
-        if isinstance(node.ctx, ast.Load):
-            self.usages.append(node.id)
-        self.generic_visit(node)
-        
-    def visit_Attribute(self, node):
-        self.usages.append(node.attr)
-        self.generic_visit(node)
+# Container/str method names (append, get, format, ...) are called on nearly every line; recording
+# them only bloats the usage sets shipped back from workers. Definitions with these names are
+# treated as used instead of being reported as dead.
+_BUILTIN_ATTRS = frozenset(
+    name for t in (list, dict, str, set) for name in dir(t) if not name.startswith('_')
+)
+
+class UsageAnalyzer:
+    node_types = (ast.Name, ast.Attribute)
 
-    def visit_Call(self, node):
+    def __init__(self):
+        self.usages = set()  # Deduplicated as recorded; only membership matters downstream
+
+    def handle(self, node):
+        if type(node) is _Attribute:
+            if node.attr not in _BUILTIN_ATTRS:
+                self.usages.add(node.attr)
+        elif type(node.ctx) is _Load:
+            self.usages.add(node.id)
+
+# Entry points / lifecycle hooks never reported as dead code
+_EXCLUDE_DEFS = frozenset({'main', 'setup'})
+
+# Call names flagged by SecurityAnalyzer
+_DANGEROUS_CALLS = frozenset({'eval', 'exec', 'subprocess'})
+
+class SecurityAnalyzer:
+    node_types = (ast.Call,)
+
+    def __init__(self):
+        self.security_bypass = []
+
+    def handle(self, node):
         # Check for dangerous calls without security check context (Basic Heuristic)
-        if isinstance(node.func, ast.Name):
-            if node.func.id in ['eval', 'exec', 'subprocess']:
-                self.security_bypass.append(f"Direct call to {node.func.id}")
+        if type(node.func) is _Name and node.func.id in _DANGEROUS_CALLS:
+            self.security_bypass.append(f"Direct call to {node.func.id}")
+
+class AuditVisitor(ast.NodeVisitor):
+    """
+    Single-pass visitor: every analyzer's handler is registered per node class once,
+    so adding an analysis adds no extra tree walk.
+    """
+    def __init__(self, analyzers):
+        self.analyzers = analyzers
+        self._registry = {}
+        for analyzer in analyzers:
+            for node_type in analyzer.node_types:
+                self._registry.setdefault(node_type, []).append(analyzer.handle)
+        # Never walk what no analyzer registered for: marker leaves, and whole expression
+        # subtrees when no analyzer looks at expressions (statements never nest inside them)
+        skip = set()
+        for base in _LEAF_TYPES:
+            if not any(issubclass(t, base) for t in self._registry):
+                skip |= _concrete_subclasses(base)
+        if not any(issubclass(t, ast.expr) for t in self._registry):
+            skip |= _concrete_subclasses(ast.expr)
+        self._skip = frozenset(skip)
+
+    def visit(self, node):
+        for handler in self._registry.get(type(node), ()):
+            handler(node)
         self.generic_visit(node)
 
-def run_audit():
+    def generic_visit(self, node):
+        """Visits every descendant of `node` in pre-order, using an explicit stack instead of recursion."""
+        registry = self._registry
+        skip = self._skip
+        stack = []
+        _push_children(node, stack, skip)
+        while stack:
+            node = stack.pop()
+            for handler in registry.get(type(node), ()):
+                handler(node)
+            _push_children(node, stack, skip)
+
+def analyze_source(content, filename='<unknown>'):
+    """
+    Parses one file's raw bytes (ast.parse honours BOMs and coding cookies) and runs the
+    standard analyzers. Returns (imports, defs, usages, security_issues).
+    """
+    tree = ast.parse(content, filename=filename)
+    imports, defs, usages, security = ImportAnalyzer(), DefinitionAnalyzer(), UsageAnalyzer(), SecurityAnalyzer()
+    AuditVisitor([imports, defs, usages, security]).visit(tree)
+    return imports.imports, defs.definitions, usages.usages, security.security_bypass
+
+def analyze_source_cached(content, cache_dir, filename='<unknown>'):
+    """
+    analyze_source memoized on disk by SHA-256 of the source, so unchanged files skip
+    both parsing and the tree walk on later runs. cache_dir=None disables the cache.
+    """
+    if cache_dir is None:
+        return analyze_source(content, filename)
+    key = hashlib.sha256(content).hexdigest()
+    path = os.path.join(cache_dir, f"{key}-{_CACHE_TAG}.pkl")
+    try:
+        with open(path, 'rb') as f:
+            result = pickle.load(f)
+        os.utime(path)  # Recently used entries survive pruning
+        return result
+    except (OSError, EOFError, pickle.UnpicklingError):
+        pass
+    result = analyze_source(content, filename)
+    try:
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)  # Atomic: readers never see a partial entry
+    except OSError:
+        pass
+    return result
+
+def _parse_one(f_path, cache_dir):
+    """Process-pool job: reads and analyzes one file. Returns (path, result, error message)."""
+    try:
+        # Raw bytes: no text decoding pass before the parser decodes the source itself
+        with open(f_path, 'rb') as f:
+            content = f.read()
+        return f_path, analyze_source_cached(content, cache_dir, f_path), None
+    except Exception as e:
+        return f_path, None, str(e)
+
+def prune_cache(cache_dir, max_entries=AUDIT_CACHE_MAX_ENTRIES):
+    """Deletes the least recently used cache entries beyond `max_entries`."""
+    try:
+        entries = [e for e in os.scandir(cache_dir) if e.name.endswith('.pkl')]
+    except OSError:
+        return
+    if len(entries) <= max_entries:
+        return
+    entries.sort(key=lambda e: e.stat().st_mtime)
+    for entry in entries[:len(entries) - max_entries]:
+        try:
+            os.remove(entry.path)
+        except OSError:
+            pass
+
+@dataclass(slots=True)
+class FileStats:
+    """Per-file records kept for the report (usages are merged into one set instead)."""
+    imports: list
+    defs: list
+    security_issues: list
+
+def run_audit(use_cache=True):
     print("Starting Architecture Audit...")
     files = get_python_files()
+    cache_dir = None
+    if use_cache:
+        os.makedirs(AUDIT_CACHE_DIR, exist_ok=True)
+        cache_dir = AUDIT_CACHE_DIR
     
     file_stats = {}
     all_usages = set()
     global_defs = defaultdict(list)
     
-    # Pass 1: Parse all files
-    for f_path in files:
-        with open(f_path, 'r', encoding='utf-8') as f:
-            try:
-                content = f.read()
-                tree = ast.parse(content)
-                visitor = AuditVisitor()
-                visitor.visit(tree)
-                
-                file_stats[f_path] = {
-                    'imports': visitor.imports,
-                    'defs': visitor.definitions,
-                    'security_issues': visitor.security_bypass
-                }
+    # Pass 1: Parse all files (across processes for large trees; only the small records come back)
+    if len(files) >= PARALLEL_MIN_FILES:
+        with ProcessPoolExecutor() as pool:
+            results = list(pool.map(_parse_one, files, [cache_dir] * len(files), chunksize=16))
+    else:
+        results = [_parse_one(f_path, cache_dir) for f_path in files]
+
+    for f_path, result, error in results:
+        if error is not None:
+            print(f"Error parsing {f_path}: {error}")
+            continue
+        imports, defs, usages, security_issues = result
+        # Normalized once here, so lookups below are exact and platform-independent
+        f_path = os.path.relpath(f_path).replace(os.sep, '/')
                 
-                for u in visitor.usages:
-                    all_usages.add(u)
-                    
-                for d in visitor.definitions:
-                    global_defs[d].append(f_path)
-                    
-            except Exception as e:
-                print(f"Error parsing {f_path}: {e}")
+        file_stats[f_path] = FileStats(imports, defs, security_issues)
+        
+        all_usages |= usages
+            
+        for d in defs:
+            global_defs[d].append(f_path)
+
+    if cache_dir is not None:
+        prune_cache(cache_dir)
 
     # Pass 2: Analysis
-    report = []
-    report.append("# ARCHITECTURE AUDIT REPORT\n")
+    report = io.StringIO()
+    report.write("# ARCHITECTURE AUDIT REPORT\n\n")
     
     # 1. Dependency Graph
-    report.append("## 1. Dependency Graph")
-    report.append("```mermaid")
-    report.append("graph TD")
+    report.write("## 1. Dependency Graph\n")
+    report.write("```mermaid\n")
+    report.write("graph TD\n")
     for f, stats in file_stats.items():
         fname = os.path.basename(f)
-        for imp in stats['imports']:
-            if imp.startswith('core'):
-                report.append(f"    {fname} --> {imp}")
-    report.append("```\n")
+        report.writelines(f"    {fname} --> {imp}\n" for imp in stats.imports if imp.startswith(CORE_DIR))
+    report.write("```\n\n")
 
     # 2. Dead Code Analysis
-    report.append("## 2. Symbol Usage & Dead Code Analysis")
-    dead_code_count = 0
-    for def_name, locations in global_defs.items():
-        if def_name not in all_usages and not def_name.startswith('__'):
-            # Filter out streamlit lifecycle methods or common overrides if needed
-            if def_name not in ['main', 'setup']: 
-                report.append(f"- 🟡 **[POSSIBLE DEAD CODE]** `{def_name}` defined in `{locations[0]}` but never called.")
-                dead_code_count += 1
+    report.write("## 2. Symbol Usage & Dead Code Analysis\n")
+    # One set difference finds the candidates; global_defs order keeps the report stable across runs
+    unused = global_defs.keys() - all_usages - _EXCLUDE_DEFS - _BUILTIN_ATTRS
+    dead_defs = [name for name in global_defs if name in unused and not name.startswith('__')]
+    for def_name in dead_defs:
+        report.write(f"- 🟡 **[POSSIBLE DEAD CODE]** `{def_name}` defined in `{global_defs[def_name][0]}` but never called.\n")
+    dead_code_count = len(dead_defs)
     
     if dead_code_count == 0:
-        report.append("✅ No obvious dead code found.\n")
+        report.write("✅ No obvious dead code found.\n\n")
     else:
-        report.append(f"\nFound {dead_code_count} potential unused symbols.\n")
+        report.write(f"\nFound {dead_code_count} potential unused symbols.\n\n")
 
     # 3. Security Analysis
-    report.append("## 3. Security Architecture")
+    report.write("## 3. Security Architecture\n")
     security_score = 100
     
-    # Check if app.py imports core.safety
-    app_imports = file_stats.get('.\\app.py', {}).get('imports', [])
-    # Normalize path usage
-    if not app_imports:
-         app_imports = file_stats.get('./app.py', {}).get('imports', [])
-         if not app_imports:
-             # Try absolute path matching or just generic search
-             for k in file_stats:
-                 if k.endswith('app.py'):
-                     app_imports = file_stats[k]['imports']
-                     break
-
-    if 'core.safety' in app_imports or 'core' in app_imports:
-        report.append("- ✅ `app.py` correctly imports `core` security modules.")
+    # Check if app.py imports core.safety (the top-level one, not any nested app.py)
+    app_stats = file_stats.get('app.py')
+    app_imports = app_stats.imports if app_stats is not None else []
+
+    if not _SAFETY_IMPORTS.isdisjoint(app_imports):
+        report.write("- ✅ `app.py` correctly imports `core` security modules.\n")
     else:
-        report.append("- 🔴 **[CRITICAL]** `app.py` does not import `core.safety`!")
+        report.write("- 🔴 **[CRITICAL]** `app.py` does not import `core.safety`!\n")
         security_score -= 50
 
     # Check for direct dangerous calls
     issues_found = False
     for f, stats in file_stats.items():
-        for issue in stats['security_issues']:
-             report.append(f"- 🔴 **[SECURITY BYPASS]** {issue} in `{f}`")
+        for issue in stats.security_issues:
+             report.write(f"- 🔴 **[SECURITY BYPASS]** {issue} in `{f}`\n")
              issues_found = True
              security_score -= 20
     
     if not issues_found:
-        report.append("- ✅ No direct `eval/exec` calls found outside of safety checks.")
+        report.write("- ✅ No direct `eval/exec` calls found outside of safety checks.\n")
 
     # 4. Architecture Health
-    report.append("\n## 4. Architecture Health Score")
+    report.write("\n## 4. Architecture Health Score\n")
     
     # Penalize for dead code
     health_score = max(0, security_score - (dead_code_count * 2))
     
-    report.append(f"**Overall Score: {health_score}/100**")
+    report.write(f"**Overall Score: {health_score}/100**\n")
     
     if health_score > 90:
-        report.append("🟢 **EXCELLENT**")
+        report.write("🟢 **EXCELLENT**\n")
     elif health_score > 70:
-        report.append("🟡 **GOOD (Needs Cleanup)**")
+        report.write("🟡 **GOOD (Needs Cleanup)**\n")
     else:
-        report.append("🔴 **CRITICAL ISSUES DETECTED**")
+        report.write("🔴 **CRITICAL ISSUES DETECTED**\n")
 
     # Output Report
     with open("ARCHITECTURE_AUDIT_REPORT.md", "w", encoding='utf-8') as f:
-        f.write("\n".join(report))
+        f.write(report.getvalue())
     
     print("Audit Complete. Report generated.")
 
 if __name__ == "__main__":
-    run_audit()
+    parser = argparse.ArgumentParser(description="Architecture audit: dependency graph, dead code and security report.")
+    parser.add_argument("--no-cache", action="store_true", help=f"Re-analyze every file instead of reusing {AUDIT_CACHE_DIR}/")
+    args = parser.parse_args()
+    run_audit(use_cache=not args.no_cache)
@@ -1,20 +1,24 @@
-try:
-    print("Importing fitz...", flush=True)
-    import fitz
-    print("fitz imported successfully.", flush=True)
-except Exception as e:
-    print(f"Failed to import fitz: {e}", flush=True)
+import importlib
+import importlib.util
+import sys
 
-try:
-    print("Importing PIL...", flush=True)
-    from PIL import Image
-    print("PIL imported successfully.", flush=True)
-except Exception as e:
-    print(f"Failed to import PIL: {e}", flush=True)
+# Probing with find_spec checks that a package is installed without executing its __init__.
+# Pass --deep to actually import each one (catches broken installs, e.g. missing shared libraries).
+MODULES = ["fitz", "PIL", "google.genai"]
+DEEP = "--deep" in sys.argv
 
-try:
-    print("Importing google.genai...", flush=True)
-    from google import genai
-    print("google.genai imported successfully.", flush=True)
-except Exception as e:
-    print(f"Failed to import google.genai: {e}", flush=True)
+for name in MODULES:
+    if DEEP:
+        try:
+            print(f"Importing {name}...", flush=True)
+            importlib.import_module(name)
+            print(f"{name} imported successfully.", flush=True)
+        except Exception as e:
+            print(f"Failed to import {name}: {e}", flush=True)
+        continue
+    try:
+        spec = importlib.util.find_spec(name)
+    except ModuleNotFoundError:
+        # Parent package (e.g. `google`) is missing
+        spec = None
+    print(f"{name} available" if spec else f"{name} missing", flush=True)
@@ -0,0 +1,18 @@
+"""Shared test inputs, built once per process instead of inside each test body."""
+import functools
+import shutil
+from typing import Final
+from PIL import Image
+
+# Minimal valid 1-page blank PDF (pdf2image requires valid PDF structure)
+MINIMAL_PDF_BYTES: Final[bytes] = b"%PDF-1.0\n1 0 obj<</Type/Catalog/Pages 2 0 R>>endobj 2 0 obj<</Type/Pages/Kids[3 0 R]/Count 1>>endobj 3 0 obj<</Type/Page/MediaBox[0 0 3 3]/Parent 2 0 R/Resources<<>>>>endobj xref\n0 4\n0000000000 65535 f\n0000000010 00000 n\n0000000060 00000 n\n0000000117 00000 n\ntrailer<</Size 4/Root 1 0 R>>startxref\n223\n%%EOF"
+
+@functools.cache
+def red_square() -> Image.Image:
+    """100x100 solid red RGB image. Shared: don't mutate it."""
+    return Image.new('RGB', (100, 100), color='red')
+
+@functools.cache
+def have_poppler() -> bool:
+    """Whether Poppler's pdftoppm (needed by pdf2image) is on PATH. Probed once per process."""
+    return shutil.which("pdftoppm") is not None
@@ -0,0 +1,24 @@
+import pathlib
+import sys
+
+# Project root on sys.path once per session, so test modules can import 'core' and 'data'
+ROOT = str(pathlib.Path(__file__).resolve().parent.parent)
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+import pytest
+from unittest.mock import MagicMock, patch, AsyncMock
+from core.engine import AletheiaEngine
+
+@pytest.fixture(scope="session")
+def shared_engine():
+    """One AletheiaEngine for the whole run (genai.Client is patched, so no real client is built)."""
+    with patch("google.genai.Client"):
+        return AletheiaEngine(api_key="dummy_key")
+
+@pytest.fixture
+def engine(shared_engine):
+    """The shared engine with a fresh mock client per test; generate_content is an AsyncMock."""
+    shared_engine.client = MagicMock()
+    shared_engine.client.aio.models.generate_content = AsyncMock()
+    return shared_engine
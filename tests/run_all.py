@@ -0,0 +1,45 @@
+import asyncio
+import os
+import sys
+
+# Add root to sys.path to allow importing 'core'
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.engine import AletheiaEngine
+from core.llm_cache import llm_cache
+from tests.test_shannon import test_shannon
+from tests.test_sql_audit import test_sql_audit
+from tests.test_vision_parser import test_vision_parser
+from tests.test_vision_manual import test_audit_visual_integrity
+
+# Record/replay store for the scripts' Gemini calls: the first live run records each (model, prompt)
+# response, later runs replay them without touching the network. Pass --live to bypass it.
+CASSETTE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cassettes", "llm_cache.sqlite3")
+
+async def main():
+    """
+    Runs the manual (live API) test scripts concurrently in one event loop, so wall-clock time
+    is the slowest script rather than the sum. The sync vision audit runs in a worker thread.
+    Output from the scripts interleaves.
+    """
+    names = ["test_shannon", "test_sql_audit", "test_vision_parser", "test_audit_visual_integrity"]
+    results = await asyncio.gather(
+        test_shannon(),
+        test_sql_audit(AletheiaEngine()),
+        test_vision_parser(),
+        asyncio.to_thread(test_audit_visual_integrity),
+        return_exceptions=True,  # One crashing script shouldn't cancel the others
+    )
+    failed = [(name, r) for name, r in zip(names, results) if isinstance(r, BaseException)]
+    for name, exc in failed:
+        print(f"CRASH: {name}: {exc!r}", flush=True)
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    if "--live" not in sys.argv:
+        os.makedirs(os.path.dirname(CASSETTE_PATH), exist_ok=True)
+        llm_cache.open(os.environ.get("ALETHEIA_TEST_CASSETTE", CASSETTE_PATH))
+    try:
+        sys.exit(asyncio.run(main()))
+    finally:
+        llm_cache.close()
@@ -1,25 +1,16 @@
 import pytest
 import json
 from unittest.mock import MagicMock, patch, AsyncMock
-from core.engine import AletheiaEngine
 
-@pytest.fixture
-def mock_genai_client():
-    with patch("google.genai.Client") as mock:
-        # returns an async mock for aio
-        mock.return_value.aio.models.generate_content = AsyncMock()
-        yield mock
-
-@pytest.fixture
-def engine(mock_genai_client):
-    return AletheiaEngine(api_key="dummy_key")
+def plan(category, code=""):
+    """Fake reply of the combined classify+optimize call."""
+    return MagicMock(text=json.dumps({"category": category, "optimized_code": code}))
 
 @pytest.mark.asyncio
 async def test_dispatch_math(engine):
-    # Mock classification
+    # Classification and JAX rewrite come back from one call
     engine.client.aio.models.generate_content.side_effect = [
-        MagicMock(text="HEAVY_MATH"), # Classification
-        MagicMock(text=json.dumps({"method": "jax", "code": "import jax"})) # JAX Gen
+        plan("HEAVY_MATH", "import jax\nx = jax.numpy.ones(3)")
     ]
     
     # Mock Security Check to pass (it runs in parallel)
@@ -30,13 +21,25 @@ async def test_dispatch_math(engine):
     result = json.loads(result_json)
     assert result["method"] == "jax"
     assert "jax" in result["code"]
+    assert engine.client.aio.models.generate_content.call_count == 1
+
+@pytest.mark.asyncio
+async def test_dispatch_math_invalid_code_uses_dedicated_jax_flow(engine):
+    engine.client.aio.models.generate_content.side_effect = [
+        plan("HEAVY_MATH", "def broken(:"), # Combined call, fails grounding
+        MagicMock(text="```python\nimport jax\n```") # Dedicated JAX Gen
+    ]
+
+    with patch("core.safety.ai_security_check_async", new_callable=AsyncMock):
+        result = json.loads(await engine.dispatch_optimization("import numpy as np"))
+
+    assert result == {"method": "jax", "code": "import jax"}
 
 @pytest.mark.asyncio
 async def test_dispatch_sql(engine):
-    # Mock classification
     engine.client.aio.models.generate_content.side_effect = [
-       MagicMock(text="SQL"), # Classification
-       MagicMock(text="SELECT * FROM optimized") # SQL Gen
+        plan("SQL"), # Classification
+        MagicMock(text="SELECT * FROM optimized") # SQL Gen
     ]
 
     with patch("core.safety.ai_security_check_async", new_callable=AsyncMock):
@@ -48,10 +51,8 @@ async def test_dispatch_sql(engine):
 
 @pytest.mark.asyncio
 async def test_dispatch_general(engine):
-    # Mock classification
     engine.client.aio.models.generate_content.side_effect = [
-       MagicMock(text="GENERAL_LOGIC"), # Classification
-       MagicMock(text="def optimized(): pass") # Async Gen
+        plan("GENERAL_LOGIC", "def optimized(): pass")
     ]
 
     with patch("core.safety.ai_security_check_async", new_callable=AsyncMock):
@@ -59,3 +60,47 @@ async def test_dispatch_general(engine):
     
     result = json.loads(result_json)
     assert result["method"] == "complexity_reducer"
+    assert result["code"] == "def optimized(): pass"
+
+@pytest.mark.asyncio
+async def test_dispatch_security_violation_cancels_plan_call(engine):
+    import asyncio
+    from core.safety import SecurityViolationException
+    cancelled = asyncio.Event()
+
+    async def slow_plan(*args, **kwargs):
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    engine.client.aio.models.generate_content.side_effect = slow_plan
+
+    with patch("core.safety.ai_security_check_async", new_callable=AsyncMock) as mock_sec:
+        mock_sec.side_effect = SecurityViolationException("AI Sentinel detected malicious intent.")
+        result_json = await asyncio.wait_for(engine.dispatch_optimization("import os"), timeout=2)
+
+    result = json.loads(result_json)
+    assert result["method"] == "error"
+    assert "malicious intent" in result["code"]
+    assert cancelled.is_set()
+
+
+@pytest.mark.asyncio
+async def test_dispatch_blank_plan_is_treated_as_failed(engine):
+    engine.client.aio.models.generate_content.side_effect = [
+        plan("HEAVY_MATH", "   \n"), # Combined call, blank rewrite
+        MagicMock(text="```python\nimport jax\n```") # Dedicated JAX Gen
+    ]
+    with patch("core.safety.ai_security_check_async", new_callable=AsyncMock):
+        result = json.loads(await engine.dispatch_optimization("import numpy as np"))
+    assert result == {"method": "jax", "code": "import jax"}
+
+    engine.client.aio.models.generate_content.side_effect = [
+        plan("GENERAL_LOGIC", ""), # Combined call, blank rewrite
+        MagicMock(text="```python\ndef optimized(): pass\n```") # General Async Refactor
+    ]
+    with patch("core.safety.ai_security_check_async", new_callable=AsyncMock):
+        result = json.loads(await engine.dispatch_optimization("print('hello')"))
+    assert result == {"method": "complexity_reducer", "code": "def optimized(): pass"}
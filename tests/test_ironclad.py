@@ -1,7 +1,7 @@
 import asyncio
 import os
 import json
-from unittest.mock import MagicMock, patch
+from unittest.mock import MagicMock, AsyncMock, patch
 from core.engine import AletheiaEngine
 from core.safety import ai_security_check, SecurityViolationException
 from core.config import MODEL_FAST, MODEL_SMART
@@ -31,12 +31,13 @@ async def test_ironclad():
             # We can't easily force the model to block "Hello World", but we can try a known bad pattern
             # Note: The model might allow checking "unsafe code" string unless checking it itself is unsafe.
             # Using a mock for the blocking case to be sure.
-            with patch('google.genai.Client') as MockClient:
+            # Reset the shared client so the patched constructor is picked up
+            with patch('google.genai.Client') as MockClient, patch('core.safety._CLIENT', None):
                 mock_instance = MockClient.return_value
                 # Mock response for unsafe code
                 mock_response = MagicMock()
                 mock_response.text = "BLOCK"
-                mock_instance.models.generate_content.return_value = mock_response
+                mock_instance.aio.models.generate_content = AsyncMock(return_value=mock_response)
                 
                 try:
                     ai_security_check(unsafe_code)
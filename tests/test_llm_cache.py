@@ -0,0 +1,81 @@
+import asyncio
+from unittest.mock import MagicMock, AsyncMock
+from core.llm_cache import LLMCache
+
+def make_client(*texts):
+    client = MagicMock()
+    client.aio.models.generate_content = AsyncMock(side_effect=[MagicMock(text=t) for t in texts])
+    return client
+
+def test_cache_disabled_until_opened():
+    cache = LLMCache()
+    client = make_client("A", "B")
+    assert asyncio.run(cache.generate(client, "m", "p")) == "A"
+    assert asyncio.run(cache.generate(client, "m", "p")) == "B"
+
+def test_cache_hit_skips_model_call(tmp_path):
+    cache = LLMCache()
+    cache.open(str(tmp_path / "cache.sqlite3"))
+    client = make_client("A", "B")
+    try:
+        assert asyncio.run(cache.generate(client, "m", "p")) == "A"
+        assert asyncio.run(cache.generate(client, "m", "p")) == "A"
+        assert client.aio.models.generate_content.call_count == 1
+        # Different model is a different key
+        assert asyncio.run(cache.generate(client, "other", "p")) == "B"
+    finally:
+        cache.close()
+
+def test_cache_discard_and_eviction(tmp_path):
+    cache = LLMCache(max_entries=2)
+    cache.open(str(tmp_path / "cache.sqlite3"))
+    try:
+        cache.put("m", "p1", "r1")
+        cache.discard("m", "p1")
+        assert cache.get("m", "p1") is None
+
+        cache.put("m", "p1", "r1")
+        cache.put("m", "p2", "r2")
+        cache.get("m", "p1") # touch: p2 is now least recently used
+        cache.put("m", "p3", "r3")
+        assert cache.get("m", "p2") is None
+        assert cache.get("m", "p1") == "r1"
+        assert cache.get("m", "p3") == "r3"
+    finally:
+        cache.close()
+
+def test_cove_verdict_cached_per_claim_and_source(tmp_path):
+    from core.llm_cache import llm_cache
+    from core.veritas import VeritasAuditor
+
+    auditor = VeritasAuditor(api_key="fake_key")
+    auditor.client = make_client('{"verdict": "TRUE"}', '{"verdict": "FALSE"}')
+    llm_cache.open(str(tmp_path / "cache.sqlite3"))
+    try:
+        assert asyncio.run(auditor.verify_claim_cove("claim", "source"))["verdict"] == "TRUE"
+        assert asyncio.run(auditor.verify_claim_cove("claim", "source"))["verdict"] == "TRUE"
+        assert auditor.client.aio.models.generate_content.call_count == 1
+        assert asyncio.run(auditor.verify_claim_cove("claim", "other source"))["verdict"] == "FALSE"
+    finally:
+        llm_cache.close()
+
+def test_generate_shares_io_concurrency_cap(monkeypatch):
+    from core.async_utils import async_manager
+    active = peak = 0
+
+    async def slow_reply(**kwargs):
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.01)
+        active -= 1
+        return MagicMock(text=kwargs["contents"])
+
+    async def fan_out():
+        monkeypatch.setattr(async_manager, "io_semaphore", asyncio.Semaphore(2))
+        client = MagicMock()
+        client.aio.models.generate_content = slow_reply
+        return await asyncio.gather(*(LLMCache().generate(client, "m", f"p{i}") for i in range(6)))
+
+    assert asyncio.run(fan_out()) == [f"p{i}" for i in range(6)]
+    assert peak == 2
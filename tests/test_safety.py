@@ -26,3 +26,106 @@ def test_run_in_sandbox_violation():
         run_in_sandbox(code)
 
 
+
+def test_checks_accept_preparsed_tree():
+    import ast
+    code = "import requests\nimport os"
+    tree = ast.parse(code)
+    is_valid, error = validate_imports(code, tree=tree)
+    assert not is_valid and "requests" in error
+    with pytest.raises(SecurityViolationException):
+        static_analysis_check(code, tree=tree)
+
+def test_sentinel_client_is_shared_per_key(monkeypatch):
+    from unittest.mock import patch
+    import core.safety as safety
+    monkeypatch.setattr(safety, "_CLIENT", None)
+    with patch("google.genai.Client") as MockClient:
+        MockClient.side_effect = lambda api_key: object()
+        monkeypatch.setenv("GEMINI_API_KEY", "key-a")
+        first = safety._get_client()
+        assert safety._get_client() is first
+        monkeypatch.setenv("GEMINI_API_KEY", "key-b")
+        assert safety._get_client() is not first
+        assert MockClient.call_count == 2
+
+def test_sync_sentinel_runs_async_check(monkeypatch):
+    from unittest.mock import MagicMock, AsyncMock
+    import core.safety as safety
+    client = MagicMock()
+    client.aio.models.generate_content = AsyncMock(return_value=MagicMock(text="BLOCK"))
+    monkeypatch.setenv("GEMINI_API_KEY", "key")
+    monkeypatch.setattr(safety, "_CLIENT", client)
+    monkeypatch.setattr(safety, "_CLIENT_KEY", "key")
+    with pytest.raises(SecurityViolationException):
+        safety.ai_security_check("print('hi')")
+    client.aio.models.generate_content.assert_awaited_once()
+
+def test_sandbox_builtins_are_restricted_and_read_only():
+    result = run_in_sandbox("print(len([1, 2]))\ntry:\n    __builtins__['leak'] = 1\nexcept TypeError:\n    print('read-only')")
+    assert "2" in result and "read-only" in result
+    assert run_in_sandbox("print('open' in __builtins__, 'len' in __builtins__)").strip() == "False True"
+
+def test_full_scan_reports_everything_in_one_pass():
+    from core.safety import full_scan, batch_scan
+    report = full_scan("import requests\nimport os\nos.system(cmd)")
+    assert report.violations == (("Banned import", "os"),)
+    assert report.disallowed_libs == ("requests", "os")
+    assert [s["sink"] for s in report.sinks] == ["os.system"]
+    assert full_scan("def (").syntax_error is not None
+
+    snippets = ["eval(x)", "print(1)", "import pickle"]
+    assert batch_scan(snippets, parallel_min=2) == [full_scan(s) for s in snippets]
+
+def test_batch_scan_survives_manager_shutdown():
+    from core.safety import full_scan, batch_scan
+    from core.async_utils import async_manager
+    async_manager.shutdown()
+    snippets = ["eval(x)", "print(1)"]
+    assert batch_scan(snippets, parallel_min=2) == [full_scan(s) for s in snippets]
+
+def test_sync_sentinel_refuses_to_block_a_running_loop():
+    import asyncio
+    import core.safety as safety
+
+    async def call_sync_shim():
+        safety.ai_security_check("print('hi')")
+
+    with pytest.raises(RuntimeError, match="ai_security_check_async"):
+        asyncio.run(call_sync_shim())
+
+def test_reproduce_paper_on_background_loop_does_not_deadlock(monkeypatch):
+    import asyncio
+    from unittest.mock import MagicMock, AsyncMock
+    import core.safety as safety
+    from core.async_utils import async_manager
+    from core.bridge import BridgeEngine
+    client = MagicMock()
+    client.aio.models.generate_content = AsyncMock(side_effect=[
+        MagicMock(text="```python\nprint(6 * 7)\n```"), # Code generation
+        MagicMock(text="SAFE"), # AI Sentinel
+    ])
+    monkeypatch.setenv("GEMINI_API_KEY", "key")
+    monkeypatch.setattr(safety, "_CLIENT", client)
+    monkeypatch.setattr(safety, "_CLIENT_KEY", "key")
+    bridge = BridgeEngine(api_key="key")
+    bridge.client = client
+    # Same path as app.py's Deep Reproduction: the coroutine runs on async_manager's loop
+    future = asyncio.run_coroutine_threadsafe(bridge.reproduce_paper("text"), async_manager._background_loop())
+    result = future.result(timeout=10)
+    assert result["execution_result"].strip() == "42"
+    assert result["status"] == "Executed Successfully"
+
+def test_sandbox_checks_skip_sink_argument_capture(monkeypatch):
+    import core.safety as safety
+    calls = []
+    real_scan_tree = safety._scan_tree
+
+    def recording_scan_tree(tree, code_str, capture_args=True):
+        calls.append(capture_args)
+        return real_scan_tree(tree, code_str, capture_args)
+
+    monkeypatch.setattr(safety, "_scan_tree", recording_scan_tree)
+    safety._full_scan_cached.cache_clear()
+    assert run_in_sandbox("print(7)").strip() == "7"
+    assert calls == [False]
@@ -0,0 +1,83 @@
+from core.utils import extract_code_block, strip_code_fences, parse_cached, source_hash, is_overload_error, TRANSIENT_ERROR_RE
+
+def test_extract_code_block_python_fence():
+    text = "Here you go:\n```python\nimport jax\nx = 1\n```\nDone."
+    assert extract_code_block(text) == "import jax\nx = 1"
+
+def test_extract_code_block_plain_fence():
+    assert extract_code_block("```\nSELECT 1;\n```") == "SELECT 1;"
+
+def test_extract_code_block_json_fence():
+    assert extract_code_block('Here:\n```json\n{"verdict": "TRUE"}\n```') == '{"verdict": "TRUE"}'
+
+def test_extract_code_block_unfenced():
+    assert extract_code_block("  print('hi')  ") == "print('hi')"
+
+def test_extract_code_block_unclosed_fence():
+    assert extract_code_block("```python\nprint('cut off')") == "print('cut off')"
+
+def test_transient_error_re():
+    assert TRANSIENT_ERROR_RE.search("429 RESOURCE_EXHAUSTED. {'error': ...}")
+    assert TRANSIENT_ERROR_RE.search("503 UNAVAILABLE: model overloaded")
+    assert not TRANSIENT_ERROR_RE.search("400 INVALID_ARGUMENT: bad request id 14290")
+
+def test_is_overload_error_prefers_status_code():
+    class FakeAPIError(Exception):
+        def __init__(self, code, message):
+            super().__init__(message)
+            self.code = code
+
+    assert is_overload_error(FakeAPIError(429, "quota"))
+    assert not is_overload_error(FakeAPIError(400, "bad request mentions 503"))
+    assert is_overload_error(RuntimeError("503 UNAVAILABLE"))
+    assert not is_overload_error(RuntimeError("boom"))
+
+def test_parse_cached_reuses_tree_for_same_source():
+    code = "x = 1\n"
+    assert parse_cached(code) is parse_cached(code, source_hash(code))
+    assert parse_cached(code) is not parse_cached("x = 2\n")
+
+def test_strip_code_fences_keeps_code_only_once():
+    assert strip_code_fences("```python\nimport x\nx.run()\n```") == "import x\nx.run()"
+    assert strip_code_fences("plain = 1\n") == "plain = 1"
+
+def test_retry_with_backoff_async_honours_retry_after():
+    import asyncio
+    from unittest.mock import patch, AsyncMock
+    from core.utils import retry_with_backoff_async
+
+    class RateLimited(Exception):
+        retry_after = 0.25
+
+    calls = []
+
+    @retry_with_backoff_async(retries=2, retry_if=lambda e: isinstance(e, RateLimited))
+    async def flaky():
+        calls.append(1)
+        if len(calls) == 1:
+            raise RateLimited("429")
+        if len(calls) == 2:
+            raise ValueError("not retryable")
+
+    with patch("core.utils.asyncio.sleep", new_callable=AsyncMock) as sleep:
+        try:
+            asyncio.run(flaky())
+        except ValueError:
+            pass
+    sleep.assert_awaited_once_with(0.25)
+    assert len(calls) == 2
+
+def test_json_dumps_round_trips():
+    from core.utils import json_dumps, json_loads
+    payload = {"method": "jax", "code": "x = 'ü'\n"}
+    assert json_loads(json_dumps(payload)) == payload
+
+def test_lazy_import_loads_on_first_attribute_access():
+    import sys
+    import importlib.util
+    from core.utils import lazy_import
+    sys.modules.pop("colorsys", None)
+    module = lazy_import("colorsys")
+    assert isinstance(module, importlib.util._LazyModule)
+    assert module.rgb_to_hsv(1.0, 0.0, 0.0) == (0.0, 1.0, 1.0)
+    assert lazy_import("colorsys") is module
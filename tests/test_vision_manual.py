@@ -1,18 +1,15 @@
+import asyncio
 import os
-import sys
-from PIL import Image
 from unittest.mock import MagicMock
 
-# Add project root to sys.path
-sys.path.append(os.getcwd())
-
-from core.vision import audit_visual_integrity
+from core.vision import audit_visual_integrity, audit_visual_integrity_async
+from _fixtures import red_square
 
 def test_audit_visual_integrity():
     print("Testing audit_visual_integrity...", flush=True)
     
-    # Create a dummy image (red square)
-    img = Image.new('RGB', (100, 100), color = 'red')
+    # Dummy image (red square), built once per process
+    img = red_square()
     
     # Mock os.environ.get to return a fake key if not present
     # But we want to test with real key if available, otherwise mock the client
@@ -40,5 +37,13 @@ def test_audit_visual_integrity():
     result = audit_visual_integrity([img])
     print(f"Result: {result}", flush=True)
 
+def test_audit_visual_integrity_async_batch():
+    print("Testing audit_visual_integrity_async with repeated figures...", flush=True)
+    img = red_square()
+    # Three copies: uploaded once, reported as a duplication pre-screen finding
+    result = asyncio.run(audit_visual_integrity_async([img, img, img]))
+    print(f"Result: {result}", flush=True)
+
 if __name__ == "__main__":
     test_audit_visual_integrity()
+    test_audit_visual_integrity_async_batch()